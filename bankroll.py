@@ -0,0 +1,232 @@
+"""This module answers bankroll questions, risk of ruin, drawdown and how
+sessions end, for a betting scheme. The engine plays a sample of rounds to
+build the distribution of a round's result in units of the bet, then every
+virtual player draws their rounds from it as one element of NumPy arrays.
+Wins and losses are booked the way BlackjackPlayer books them.
+"""
+__all__ = ['outcome_distribution', 'flat_bet', 'Martingale',
+           'BankrollSimulator', 'BankrollResult']
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from cards import Blackjack
+from players import MINIMUM_BET, MAXIMUM_BET
+from simulation import STRATEGIES, play_round
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def outcome_distribution(strategy, hands=200000, decks=2, shuffle=25,
+                         rng=None):
+    """Play hands rounds with the strategy and return (units, probabilities),
+    the distinct results of a round in units of the bet, -1 for a loss and
+    1.5 for a blackjack for example, and how often each came up.
+    """
+
+    bet = 2  # Even, so a blackjack pays a whole number
+    game = Blackjack(bet, decks=decks, shuffle=shuffle, rng=rng)
+    player = game.player
+    counts = {}
+    for hand in range(hands):
+        money = player.money
+        play_round(game, strategy)
+        net = (player.money - money) / bet
+        counts[net] = counts.get(net, 0) + 1
+
+    units = np.array(sorted(counts), dtype=np.float64)
+    probabilities = np.array([counts[unit] for unit in sorted(counts)],
+                             dtype=np.float64) / hands
+    return units, probabilities
+
+
+def flat_bet(bets, last_units):
+    """Betting scheme that keeps every bet where it is."""
+
+    return bets
+
+
+class Martingale(object):
+    """Betting scheme that doubles the bet after a loss and drops back to
+    base after anything else.
+    """
+
+    def __init__(self, base=MINIMUM_BET):
+        self.base = base
+
+    def __call__(self, bets, last_units):
+        return np.where(last_units < 0, bets * 2, self.base)
+
+
+class BankrollResult(object):
+    """Per player arrays from a BankrollSimulator run."""
+
+    def __init__(self, simulator, hands, elapsed):
+        self.players = len(simulator.money)
+        self.hands = hands
+        self.bankroll = simulator.bankroll
+        self.money = simulator.money.copy()
+        self.highest_win = simulator.highest_win.copy()
+        self.highest_loss = simulator.highest_loss.copy()
+        self.drawdown = simulator.drawdown.copy()
+        self.ruined_at = simulator.ruined_at.copy()  # -1 if never ruined
+        self.elapsed = elapsed
+
+    def risk_of_ruin(self):
+        """Return the fraction of players that went broke."""
+
+        return np.count_nonzero(self.ruined_at >= 0) / self.players
+
+    def percentiles(self, values):
+        """Return the PERCENTILES of an array as a dict."""
+
+        return dict(zip(PERCENTILES, np.percentile(values, PERCENTILES)))
+
+    def summary(self):
+        """Return the results formatted for printing."""
+
+        lines = ['Players: {0:,}  Hands each: {1:,}  '
+                 'Bankroll: {2:,.2f}'.format(self.players, self.hands,
+                                             self.bankroll),
+                 'Risk of ruin: {0:.2%}'.format(self.risk_of_ruin()),
+                 'Expected drawdown: {0:,.2f}'.format(self.drawdown.mean()),
+                 'Expected final money: {0:,.2f}'.format(self.money.mean())]
+        ruined = self.ruined_at[self.ruined_at >= 0]
+        if len(ruined):
+            lines.append('Median hands to ruin: {0:,.0f}'.format(
+                np.median(ruined) + 1))
+
+        lines.append('{0:>16}'.format('percentile') + ''.join(
+            '{0:>10}'.format(p) for p in PERCENTILES))
+        for name, values in (('final money', self.money),
+                             ('max drawdown', self.drawdown),
+                             ('highest win', self.highest_win),
+                             ('highest loss', self.highest_loss)):
+            lines.append('{0:>16}'.format(name) + ''.join(
+                '{0:>10,.0f}'.format(v)
+                for v in self.percentiles(values).values()))
+
+        lines.append('Player hands/sec: {0:,.0f}'.format(
+            self.players * self.hands / self.elapsed if self.elapsed else 0))
+        return '\n'.join(lines)
+
+
+class BankrollSimulator(object):
+    """Plays the bankrolls of many players at once, every player drawing
+    independent rounds from an outcome_distribution.
+
+    betting is called as betting(bets, last_units) before every round with
+    the array of current bets and the last round's results in bet units,
+    and returns the next bets. Bets are kept between min_bet and max_bet
+    and never more than the player has. A player who cannot cover min_bet
+    is ruined and sits out the rest of the run.
+    """
+
+    def __init__(self, units, probabilities, players=100000, bankroll=500,
+                 bet=MINIMUM_BET, betting=flat_bet, min_bet=MINIMUM_BET,
+                 max_bet=MAXIMUM_BET, seed=None):
+        self.units = np.asarray(units, dtype=np.float64)
+        self.cumulative = np.cumsum(probabilities)
+        self.cumulative /= self.cumulative[-1]
+        self.rng = np.random.default_rng(seed)
+        self.bankroll = bankroll
+        self.betting = betting
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+
+        # BlackjackPlayer's money, current_bet, highest_win and highest_loss
+        self.money = np.full(players, bankroll, dtype=np.float64)
+        self.bets = np.full(players, bet, dtype=np.float64)
+        self.highest_win = np.zeros(players)
+        self.highest_loss = np.zeros(players)
+        self.peak = self.money.copy()
+        self.drawdown = np.zeros(players)  # Largest fall from a peak
+        self.ruined_at = np.full(players, -1, dtype=np.int64)
+        self.last_units = np.zeros(players)
+        self.played = 0
+
+    def step(self):
+        """Play one round for every player still in the game."""
+
+        active = np.flatnonzero(self.ruined_at < 0)
+        if not len(active):
+            return
+
+        bets = self.betting(self.bets[active], self.last_units[active])
+        money = self.money[active]
+        bets = np.minimum(np.clip(bets, self.min_bet, self.max_bet), money)
+
+        index = np.searchsorted(self.cumulative,
+                                self.rng.random(len(active)), side='right')
+        units = self.units[np.minimum(index, len(self.units) - 1)]
+        net = units * bets
+        money += net
+
+        # Same bookkeeping as BlackjackPlayer.winner and loser
+        self.highest_win[active] = np.maximum(self.highest_win[active], net)
+        self.highest_loss[active] = np.maximum(self.highest_loss[active],
+                                               -net)
+
+        peak = np.maximum(self.peak[active], money)
+        self.peak[active] = peak
+        self.drawdown[active] = np.maximum(self.drawdown[active],
+                                           peak - money)
+        self.money[active] = money
+        self.bets[active] = bets
+        self.last_units[active] = units
+        self.ruined_at[active[money < self.min_bet]] = self.played
+        self.played += 1
+
+    def run(self, hands):
+        """Play hands rounds and return a BankrollResult."""
+
+        start = time.perf_counter()
+        for hand in range(hands):
+            self.step()
+        return BankrollResult(self, self.played, time.perf_counter() - start)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Estimate risk of ruin and drawdown for a bankroll.')
+    parser.add_argument('-p', '--players', type=int, default=100000,
+                        help='number of virtual players')
+    parser.add_argument('-n', '--hands', type=int, default=1000,
+                        help='rounds each player plays')
+    parser.add_argument('--bankroll', type=float, default=500,
+                        help='money each player starts with')
+    parser.add_argument('-b', '--bet', type=int, default=MINIMUM_BET,
+                        help='starting bet')
+    parser.add_argument('--martingale', action='store_true',
+                        help='double the bet after every loss')
+    parser.add_argument('-s', '--strategy', choices=sorted(STRATEGIES),
+                        default='dealer', help='player strategy')
+    parser.add_argument('-d', '--decks', type=int, default=2,
+                        help='number of decks in the shoe')
+    parser.add_argument('--sample', type=int, default=200000,
+                        help='rounds the engine plays for the distribution')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for a reproducible run')
+    args = parser.parse_args(argv)
+
+    units, probabilities = outcome_distribution(
+        STRATEGIES[args.strategy], args.sample, decks=args.decks,
+        rng=random.Random(args.seed))
+    print('Per round: ' + '  '.join('{0:+g}: {1:.2%}'.format(u, p)
+                                    for u, p in zip(units, probabilities)))
+    print('EV per unit bet: {0:+.4f}'.format(units @ probabilities))
+
+    betting = Martingale(args.bet) if args.martingale else flat_bet
+    simulator = BankrollSimulator(units, probabilities, players=args.players,
+                                  bankroll=args.bankroll, bet=args.bet,
+                                  betting=betting, seed=args.seed)
+    print(simulator.run(args.hands).summary())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,299 @@
+"""This module plays many independent shoes of Blackjack at once with NumPy.
+Every shoe is a row of a 2-D array of card codes and all of the rows play
+their rounds in lock-step under a fixed hit/stay table, following the same
+rules and payouts as the Blackjack class in cards.py.
+"""
+__all__ = ['strategy_table', 'table_strategy', 'BatchSimulator', 'verify']
+
+import time
+from array import array
+
+import numpy as np
+
+from cards import Blackjack, CardDeck, BLACKJACK_VALUES, BLACKJACK_PAYOUT
+from cards import cut_card
+from simulation import SimulationResult, play_round
+
+VALUES = np.frombuffer(BLACKJACK_VALUES, dtype=np.int8)  # Code to points
+
+
+def _sample_hands():
+    """Yield (soft, total, card values) for a two or three card hand of
+    every hard total from 4 to 21 and soft total from 12 to 21.
+    """
+
+    for total in range(4, 22):
+        if total == 4:
+            cards = (2, 2)
+        elif total <= 11:
+            cards = (2, total - 2)
+        elif total <= 20:
+            cards = (10, total - 10)
+        else:
+            cards = (10, 9, 2)
+        yield 0, total, cards
+
+    for total in range(12, 22):
+        yield 1, total, (1, total - 11)
+
+
+def strategy_table(strategy):
+    """Ask a strategy callback for its decision on every hand against every
+    dealer upcard and return a boolean hit table indexed by
+    [soft, total, upcard value].
+    """
+
+    from players import BlackjackPlayer
+
+    deck = CardDeck(values=BLACKJACK_VALUES)
+    player = BlackjackPlayer()
+    table = np.zeros((2, 22, 11), dtype=bool)
+
+    for up in range(1, 11):
+        upcard = deck.card(up - 1)
+        for soft, total, cards in _sample_hands():
+            player.reset()
+            for value in cards:
+                player.take_card(deck.card(value - 1))
+            table[soft, total, up] = strategy(player, upcard) == 'hit'
+
+    return table
+
+
+def table_strategy(table):
+    """Return a strategy callback for simulation.play_round that plays
+    from a hit table built by strategy_table.
+    """
+
+    hits = np.asarray(table).tolist()
+
+    def strategy(player, upcard):
+        if hits[player.is_soft()][player.score()][upcard.value]:
+            return 'hit'
+        return 'stay'
+
+    return strategy
+
+
+def _score(hard, ace):
+    """Vectorized BlackjackDealer.score()."""
+
+    return np.where(ace & (hard <= 11), hard + 10, hard)
+
+
+class BatchSimulator(object):
+    """Plays one round on each of many shoes per step."""
+
+    def __init__(self, table, shoes=1000, decks=2, shuffle=25, bet=5,
+                 seed=None, hit_soft_17=False):
+        self.table = np.asarray(table, dtype=bool)
+        self.hit_soft_17 = hit_soft_17
+        self.shoe_count = int(shoes)
+        self.deck_count = int(decks)
+        self.shuffle = shuffle
+        self.bet = bet
+        self.rng = np.random.default_rng(seed)
+
+        card_total = 52 * self.deck_count
+        base = np.tile(np.arange(52, dtype=np.int8), self.deck_count)
+        self.codes = np.tile(base, (self.shoe_count, 1))
+        self.rng.permuted(self.codes, axis=1, out=self.codes)
+        self.values = VALUES[self.codes].ravel()  # Points, one flat array
+        self.position = np.zeros(self.shoe_count, dtype=np.intp)
+        self.round_start = np.zeros(self.shoe_count, dtype=np.intp)
+        self.card_total = card_total
+        self.offset = np.arange(self.shoe_count) * card_total  # Row starts
+
+        self.cut = cut_card(card_total, shuffle)  # Same as Blackjack
+
+        self.net = np.zeros(self.shoe_count)  # Money won or lost per shoe
+        self.hands = np.zeros(self.shoe_count, dtype=np.int64)
+        self.result = SimulationResult()
+
+    def _draw(self, rows):
+        """Draw the next card from each of the given shoes."""
+
+        position = self.position[rows]
+        empty = position >= self.card_total
+        if empty.any():  # Never read on into the next shoe's row
+            self._reshuffle_discards(rows[empty])
+            position = self.position[rows]
+        self.position[rows] = position + 1
+        return self.values[self.offset[rows] + position].astype(np.int16)
+
+    def _reshuffle_discards(self, rows):
+        """Shuffle the discards of earlier rounds back in behind the cards
+        in play for shoes that ran out mid round, like
+        CardDeck.reshuffle_discards.
+        """
+
+        values = self.values.reshape(self.codes.shape)
+        for row in rows:
+            start = self.round_start[row]
+            if not start:
+                raise IndexError('draw from an empty deck')
+            codes = self.codes[row]
+            in_play = len(codes) - start
+            codes[:] = np.concatenate((codes[start:],
+                                       self.rng.permuted(codes[:start])))
+            values[row] = VALUES[codes]
+            self.position[row] = in_play
+            self.round_start[row] = 0
+        self.result.reshuffles += len(rows)
+
+    def reshuffle(self, rows):
+        """Shuffle the given shoes and put them back to their first card."""
+
+        if len(rows) == self.shoe_count:
+            self.rng.permuted(self.codes, axis=1, out=self.codes)
+            self.values[:] = VALUES[self.codes].ravel()
+        else:
+            codes = self.rng.permuted(self.codes[rows], axis=1)
+            self.codes[rows] = codes
+            values = self.values.reshape(self.codes.shape)
+            values[rows] = VALUES[codes]
+        self.position[rows] = 0
+        self.result.reshuffles += len(rows)
+
+    def step(self, reshuffle=True):
+        """Play one round on every shoe. Shoes that have reached the cut
+        are shuffled first, or sit the round out if reshuffle is False.
+        Return the number of rounds played.
+        """
+
+        needs_shuffle = self.position >= self.cut
+        if reshuffle:
+            if needs_shuffle.any():
+                self.reshuffle(np.flatnonzero(needs_shuffle))
+            rows = np.arange(self.shoe_count)
+        else:
+            rows = np.flatnonzero(~needs_shuffle)
+        if not len(rows):
+            return 0
+        self.round_start[rows] = self.position[rows]
+
+        # Same order as Blackjack.deal: the player's first card, the
+        # dealer's upcard, the player's second card, then the hole card.
+        first = self._draw(rows)
+        up = self._draw(rows)
+        second = self._draw(rows)
+        hole = self._draw(rows)
+        dealer_hard = hole + up
+        dealer_ace = (hole == 1) | (up == 1)
+        player_hard = first + second
+        player_ace = (first == 1) | (second == 1)
+
+        player_natural = player_ace & (player_hard == 11)
+        dealer_natural = dealer_ace & (dealer_hard == 11)
+        playing = ~(player_natural | dealer_natural)
+
+        active = playing.copy()
+        while True:
+            total = _score(player_hard, player_ace)
+            soft = (player_ace & (player_hard <= 11)).astype(np.intp)
+            active &= total < 21
+            index = np.flatnonzero(active)
+            active[index] = self.table[soft[index], total[index], up[index]]
+            index = np.flatnonzero(active)
+            if not len(index):
+                break
+            cards = self._draw(rows[index])
+            player_hard[index] += cards
+            player_ace[index] |= cards == 1
+
+        player_bust = player_hard > 21
+        active = playing & ~player_bust
+        while True:
+            dealer_total = _score(dealer_hard, dealer_ace)
+            hits = dealer_total < 17
+            if self.hit_soft_17:
+                hits |= ((dealer_total == 17) & dealer_ace &
+                         (dealer_hard <= 11))
+            active &= hits
+            index = np.flatnonzero(active)
+            if not len(index):
+                break
+            cards = self._draw(rows[index])
+            dealer_hard[index] += cards
+            dealer_ace[index] |= cards == 1
+
+        player_total = _score(player_hard, player_ace)
+        dealer_total = _score(dealer_hard, dealer_ace)
+        dealer_bust = dealer_hard > 21
+
+        win = playing & ~player_bust & (dealer_bust |
+                                        (player_total > dealer_total))
+        blackjack = player_natural & ~dealer_natural
+        push = ((player_natural & dealer_natural) |
+                (playing & ~player_bust & ~dealer_bust &
+                 (player_total == dealer_total)))
+        lose = ~(win | blackjack | push)
+
+        net = (win * self.bet + blackjack * (self.bet * BLACKJACK_PAYOUT)
+               - lose * self.bet)
+        self.net[rows] += net
+        self.hands[rows] += 1
+
+        result = self.result
+        result.hands += len(rows)
+        result.wins += int(win.sum())
+        result.blackjacks += int(blackjack.sum())
+        result.pushes += int(push.sum())
+        result.losses += int(lose.sum())
+        result.busts += int(player_bust.sum())
+        result.net += float(net.sum())
+
+        return len(rows)
+
+    def run(self, hands):
+        """Play at least the given number of rounds spread across every
+        shoe and return the SimulationResult.
+        """
+
+        start = time.perf_counter()
+        played = 0
+        while played < hands:
+            played += self.step()
+        self.result.elapsed += time.perf_counter() - start
+
+        return self.result
+
+
+def verify(table, shoes=50, decks=2, shuffle=25, bet=5, seed=0,
+           hit_soft_17=False):
+    """Play every shoe of a BatchSimulator to its cut, replay the same card
+    orders through the scalar Blackjack class, and return True if every
+    shoe ends with the same hand count and money.
+
+    Raise ValueError if a shoe ran out mid round, as a single deck dealt
+    close to its end does: the two classes then shuffle the discards back
+    in with different generators, and the card orders part ways.
+    """
+
+    batch = BatchSimulator(table, shoes=shoes, decks=decks, shuffle=shuffle,
+                           bet=bet, seed=seed, hit_soft_17=hit_soft_17)
+    orders = batch.codes.copy()
+    while batch.step(reshuffle=False):
+        pass
+    if batch.result.reshuffles:
+        raise ValueError('{0} shoes ran out mid round, verify needs more '
+                         'cards behind the cut'.format(
+                             batch.result.reshuffles))
+
+    strategy = table_strategy(table)
+    for row in range(shoes):
+        game = Blackjack(bet, decks=decks, shuffle=shuffle,
+                         hit_soft_17=hit_soft_17)
+        game.deck.deck = array('b', orders[row].tobytes())
+        game.deck.position = 0
+        hands = 0
+        while not game._shuffle_time():
+            play_round(game, strategy)
+            hands += 1
+
+        if hands != batch.hands[row]:
+            return False
+        if game.player.money - 500 != batch.net[row]:
+            return False
+
+    return True
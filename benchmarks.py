@@ -0,0 +1,543 @@
+"""Timing benchmarks for the Blackjack game engine.
+
+Run directly with ``python benchmarks.py``. The default suite times every
+engine hot path and the game window startup, and can save its results as
+JSON or compare them against a saved baseline:
+
+    python benchmarks.py --json baseline.json
+    python benchmarks.py --baseline baseline.json --threshold 0.2
+
+Pass --reports to also print the longer comparison reports.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from collections import deque
+
+from cards import CardDeck, PlayingCard, SUITS, NAMES
+
+
+def legacy_shuffle(decks):
+    """Rebuild and shuffle a shoe the way CardDeck did before it was
+    array backed: a new PlayingCard per card in a deque, shuffled seven
+    times per deck.
+    """
+
+    deck = deque()
+    for count in range(decks):
+        for suit in SUITS:
+            for num, name in enumerate(NAMES, start=1):
+                card = PlayingCard()
+                card.set_attributes(name, suit, num)
+                deck.append(card)
+
+    for deck_shuffle in range(decks * 7):
+        random.shuffle(deck)
+
+    return deck
+
+
+def bench_shuffle(deck_counts=(1, 2, 6, 8), repeat=5):
+    """Compare the in-place reshuffle against the legacy rebuild."""
+
+    print('Reshuffle (best of {0}, ms per shuffle)'.format(repeat))
+    print('{0:>6} {1:>10} {2:>10} {3:>8}'.format('decks', 'legacy',
+                                                 'in-place', 'speedup'))
+
+    for decks in deck_counts:
+        shoe = CardDeck(decks)
+        number = max(1, 40 // decks)
+        legacy = min(timeit.repeat(lambda: legacy_shuffle(decks),
+                                   number=number, repeat=repeat)) / number
+        number = 1000
+        current = min(timeit.repeat(shoe.shuffle, number=number,
+                                    repeat=repeat)) / number
+        print('{0:>6} {1:>10.3f} {2:>10.3f} {3:>7.0f}x'.format(
+            decks, legacy * 1000, current * 1000, legacy / current))
+
+
+def bench_batch(hands=200000, shoes=20000):
+    """Compare the NumPy batch engine with the scalar simulation loop."""
+
+    try:
+        import batch
+    except ImportError:
+        print('Batch simulation skipped, NumPy is not installed')
+        return
+
+    import simulation
+
+    scalar = simulation.simulate(simulation.mimic_dealer, hands // 10)
+    table = batch.strategy_table(simulation.mimic_dealer)
+    vector = batch.BatchSimulator(table, shoes=shoes, seed=0).run(hands)
+
+    print('Fixed strategy simulation (hands/sec)')
+    print('{0:>10} {1:>12,.0f}'.format('scalar', scalar.hands_per_sec()))
+    print('{0:>10} {1:>12,.0f} {2:>7.0f}x'.format(
+        'batch', vector.hands_per_sec(),
+        vector.hands_per_sec() / scalar.hands_per_sec()))
+
+
+def bench_seats(hands=100000, decks=6, seed=0):
+    """Compare seat hands per second at tables of one to seven seats
+    sharing one shoe.
+    """
+
+    import simulation
+    from cards import MAX_SEATS
+
+    print('Seats sharing a {0} deck shoe (seat hands/sec)'.format(decks))
+    single = None
+    for seats in range(1, MAX_SEATS + 1):
+        result = simulation.simulate(simulation.mimic_dealer,
+                                     hands // seats, decks=decks,
+                                     rng=random.Random(seed), seats=seats)
+        if single is None:
+            single = result.hands_per_sec()
+        print('{0:>4} seats {1:>12,.0f} {2:>6.2f}x'.format(
+            seats, result.hands_per_sec(), result.hands_per_sec() / single))
+
+
+def bench_allocations(rounds=50000, decks=6, seed=0):
+    """Count the Hand objects allocated per round of split heavy basic
+    strategy, against one per split hand without the pool, and the memory
+    blocks left allocated per round.
+    """
+
+    import simulation
+    from cards import Blackjack
+
+    game = Blackjack(5, decks=decks, rng=random.Random(seed), seats=7)
+    simulation.play_seats(game, simulation.basic_strategy)  # Warm up
+    created = game.pool.created
+    split_hands = 0
+    blocks = sys.getallocatedblocks()
+    for round_ in range(rounds):
+        simulation.play_seats(game, simulation.basic_strategy)
+        for player in game.players:
+            split_hands += len(player.hands) - 1
+    blocks = sys.getallocatedblocks() - blocks
+
+    print('Allocations per round, 7 seats of basic strategy')
+    print('{0:>24} {1:>10.4f}'.format('hands, unpooled',
+                                      split_hands / rounds))
+    print('{0:>24} {1:>10.4f}'.format('hands, pooled',
+                                      (game.pool.created - created) / rounds))
+    print('{0:>24} {1:>10.4f}'.format('live blocks added', blocks / rounds))
+
+
+def bench_profiles(tables=2000, rounds=20, decks=6, seed=0):
+    """Compare sustained settlements per second with many tables writing
+    to one profile database, committing every hand against batching
+    commits per flush interval.
+    """
+
+    import tempfile
+    import simulation
+    from cards import Blackjack
+    from profiles import ProfileStore
+
+    rng = random.Random(seed)
+    games = []
+    for table in range(tables):
+        game = Blackjack(5, decks=decks, rng=rng)
+        game.player.name = 'table-{0}'.format(table)
+        games.append(game)
+
+    print('Profile settlements with {0:,} tables'.format(tables))
+    print('{0:>16} {1:>14} {2:>10} {3:>14}'.format(
+        'flush interval', 'settles/sec', 'commits', 'store us/settle'))
+    for interval in (0, 0.1, 1.0):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ProfileStore(os.path.join(directory, 'profiles.db'),
+                                 flush_interval=interval)
+            for game in games:
+                store.load(game.player)
+            stored = 0.0
+            start = time.perf_counter()
+            for round_ in range(rounds):
+                for game in games:
+                    simulation.play_seats(game, simulation.mimic_dealer)
+                    settle_start = time.perf_counter()
+                    store.settle(game.player, len(game.player.hands))
+                    stored += time.perf_counter() - settle_start
+            store.close()
+            elapsed = time.perf_counter() - start
+        settles = tables * rounds
+        print('{0:>15g}s {1:>14,.0f} {2:>10,} {3:>14.1f}'.format(
+            interval, settles / elapsed, store.commits,
+            stored / settles * 1e6))
+
+
+def bench_scaling(hands=400000, seed=0):
+    """Time the process pool runner from one worker up to every CPU and
+    check that each worker count gives the same totals.
+    """
+
+    import parallel
+    import simulation
+
+    counts = [1]
+    while counts[-1] * 2 <= os.cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != os.cpu_count():
+        counts.append(os.cpu_count())
+
+    print('Parallel scaling, {0} hands (hands/sec)'.format(hands))
+    baseline = None
+    for workers in counts:
+        result = parallel.run_parallel(simulation.mimic_dealer, hands,
+                                       seed=seed, workers=workers)
+        if baseline is None:
+            baseline = result
+        same = 'same' if result.net == baseline.net else 'DIFFERENT'
+        print('{0:>4} workers {1:>12,.0f} {2:>6.2f}x  totals {3}'.format(
+            workers, result.hands_per_sec(),
+            result.hands_per_sec() / baseline.hands_per_sec(), same))
+
+
+EXACT_COLD_TARGET = 0.250  # Seconds for the first decision after a shuffle
+EXACT_WARM_TARGET = 0.050  # Mean seconds for later decisions in the shoe
+
+
+def bench_exact(deck_counts=(1, 2, 6, 8), decisions=200, seed=0):
+    """Time Blackjack.expected_values with a cold cache right after a
+    shuffle and a warm cache for the decisions that follow in the shoe,
+    next to the hit rates of the dealer draw tables, the dealer odds and
+    the player decisions.
+    """
+
+    from cards import Blackjack
+
+    print('Exact EV per decision (ms), targets {0:.0f} cold / {1:.0f} '
+          'warm'.format(EXACT_COLD_TARGET * 1000, EXACT_WARM_TARGET * 1000))
+    print('{0:>6} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8}'.format(
+        'decks', 'cold', 'warm', 'tables', 'dealer', 'player'))
+
+    for decks in deck_counts:
+        game = Blackjack(5, decks=decks, rng=random.Random(seed))
+        cold = []
+        warm = []
+        hits = {}
+        misses = {}
+        shuffles = None
+        while len(warm) < decisions:
+            if game._shuffle_time():
+                game.deck.shuffle()
+            game.deal()
+            if game.deck.shuffles != shuffles:
+                # expected_values() is about to clear the caches, keep what
+                # they counted in the shoe before
+                for name, cache in game.calculator.cache_info().items():
+                    hits[name] = hits.get(name, 0) + cache['hits']
+                    misses[name] = misses.get(name, 0) + cache['misses']
+            start = timeit.default_timer()
+            game.expected_values()
+            elapsed = timeit.default_timer() - start
+            if game.deck.shuffles != shuffles:
+                cold.append(elapsed)
+                shuffles = game.deck.shuffles
+            else:
+                warm.append(elapsed)
+
+        rates = []
+        for name, cache in game.calculator.cache_info().items():
+            hit = hits.get(name, 0) + cache['hits']
+            rates.append(hit / max(1, hit + misses.get(name, 0) +
+                                   cache['misses']))
+        cold_time = max(cold) if cold else 0.0
+        warm_time = sum(warm) / len(warm)
+        status = 'ok'
+        if cold_time > EXACT_COLD_TARGET or warm_time > EXACT_WARM_TARGET:
+            status = 'SLOW'
+        print('{0:>6} {1:>8.1f} {2:>8.1f} {3:>8.1%} {4:>8.1%} {5:>8.1%}  '
+              '{6}'.format(decks, cold_time * 1000, warm_time * 1000,
+                           *(rates + [status])))
+
+
+def _time_per_call(func, calls, repeat):
+    """Return the best seconds per call of func over repeat runs."""
+
+    return min(timeit.repeat(func, number=calls, repeat=repeat)) / calls
+
+
+def suite_engine(deck_counts=(1, 2, 6, 8), hands=20000, repeat=3):
+    """Time each engine hot path and return seconds per operation, keyed
+    by operation name and deck count.
+    """
+
+    from cards import Blackjack
+    from simulation import mimic_dealer, play_round
+
+    results = {}
+    for decks in deck_counts:
+        rng = random.Random(decks)
+
+        deck = CardDeck(decks, rng=rng)
+        results['CardDeck.shuffle[decks={0}]'.format(decks)] = \
+            _time_per_call(deck.shuffle, 200, repeat)
+
+        def draw_shoes():
+            elapsed = 0.0
+            draws = 0
+            while draws < hands:
+                deck.shuffle()
+                count = len(deck)
+                start = timeit.default_timer()
+                for card in range(count):
+                    deck.draw()
+                elapsed += timeit.default_timer() - start
+                draws += count
+            return elapsed / draws
+        results['CardDeck.draw[decks={0}]'.format(decks)] = \
+            min(draw_shoes() for run in range(repeat))
+
+        game = Blackjack(5, decks=decks, rng=rng)
+
+        results['Blackjack.deal[decks={0}]'.format(decks)] = \
+            _time_per_call(game.deal, hands, repeat)
+
+        def hits():
+            elapsed = 0.0
+            for hand in range(hands):
+                game.deal()
+                start = timeit.default_timer()
+                game.hit(game.player)
+                elapsed += timeit.default_timer() - start
+            return elapsed / hands
+        results['Blackjack.hit[decks={0}]'.format(decks)] = \
+            min(hits() for run in range(repeat))
+
+        game.deal()
+        player = game.player
+        results['Blackjack.check_hand[decks={0}]'.format(decks)] = \
+            _time_per_call(lambda: game.check_hand(player), hands, repeat)
+        results['BlackjackDealer.score[decks={0}]'.format(decks)] = \
+            _time_per_call(player.score, hands, repeat)
+
+        def round_():
+            play_round(game, mimic_dealer)
+        results['play_round[decks={0}]'.format(decks)] = \
+            _time_per_call(round_, hands, repeat)
+
+    return results
+
+
+HEADLESS_MODULES = ('cards', 'players', 'simulation')
+HEADLESS_IMPORT_BUDGET = 0.050  # Seconds to import the engine without Tk
+
+
+def suite_import(repeat=3):
+    """Import the engine modules in a fresh interpreter under
+    -X importtime and return the best total seconds. Raise RuntimeError
+    if the import pulls in tkinter.
+    """
+
+    code = 'import ' + ', '.join(HEADLESS_MODULES)
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for run in range(repeat):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 code], cwd=here, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=True).stderr
+        total = 0
+        for line in output.splitlines():
+            if not line.startswith('import time:') or '[us]' in line:
+                continue
+            self_us, cumulative, name = line[12:].split('|')
+            if name.strip() == 'tkinter':
+                raise RuntimeError('headless import loaded tkinter')
+            if name[1:] in HEADLESS_MODULES:  # Top level, not nested
+                total += int(cumulative)
+        if best is None or total < best:
+            best = total
+
+    return {'import.headless': best / 1e6}
+
+
+def _start_xvfb():
+    """Start a virtual X server if there is no display and Xvfb is
+    installed. Return the server process or None.
+    """
+
+    if os.environ.get('DISPLAY') or sys.platform.startswith('win'):
+        return None
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        if os.access(os.path.join(path, 'Xvfb'), os.X_OK):
+            break
+    else:
+        return None
+
+    display = ':{0}'.format(90 + os.getpid() % 100)
+    server = subprocess.Popen(['Xvfb', display, '-nolisten', 'tcp'],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    time.sleep(0.5)  # Give the server a moment to accept connections
+    os.environ['DISPLAY'] = display
+    return server
+
+
+def suite_gui(repeat=3, autoplay_hands=5000):
+    """Time GameWindow construction up to its first idle with the main
+    loop stubbed out, then the table redraws of manual play and of
+    autoplay. Return an empty dict if no display is available.
+    """
+
+    server = _start_xvfb()
+    try:
+        import threading
+        import tkinter
+        from simulation import STRATEGIES
+        from windows import GameWindow
+
+        real_mainloop = tkinter.Misc.mainloop
+        tkinter.Misc.mainloop = lambda widget, n=0: widget.update()
+        try:  # GameWindow runs its main loop, so keep it stubbed throughout
+            timings = []
+            for run in range(repeat):
+                start = timeit.default_timer()
+                window = GameWindow('Player')
+                timings.append(timeit.default_timer() - start)
+                window.root.destroy()
+            results = {'GameWindow.startup': min(timings)}
+
+            window = GameWindow('Player')
+            for hand in range(200):
+                window._deal_handler()
+                window._hit_handler()
+                window._stand_handler()
+                window.root.update_idletasks()
+            results['GameWindow.redraw'] = \
+                window.redrawTime / window.redrawCount
+
+            # Frames drawn while the autoplay worker plays as fast as it can
+            redraws = window.redrawCount
+            redraw_time = window.redrawTime
+            window.autoplayHands = autoplay_hands
+            window.autoplayThread = threading.Thread(
+                target=window._autoplay_worker,
+                args=(autoplay_hands, STRATEGIES['dealer']), daemon=True)
+            window.autoplayThread.start()
+            window._drain_autoplay()
+            while window._autoplaying():
+                window.root.update()
+                time.sleep(0.001)  # Leave the worker the interpreter
+            results['GameWindow.autoplay_redraw'] = \
+                (window.redrawTime - redraw_time) / \
+                max(1, window.redrawCount - redraws)
+            window.root.destroy()
+        except tkinter.TclError:
+            return {}
+        finally:
+            tkinter.Misc.mainloop = real_mainloop
+
+        if os.path.isdir('images'):
+            from cardimages import CardImages
+            root = tkinter.Tk()
+            images = CardImages(root)
+            images.preload()
+            results['CardImages.preload'] = images.load_time
+            root.destroy()
+
+        return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def compare(results, baseline, threshold):
+    """Return the names of the results that are slower than the baseline
+    by more than threshold, a fraction.
+    """
+
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous and seconds > previous * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Blackjack benchmarks.')
+    parser.add_argument('-d', '--decks', type=int, nargs='+',
+                        default=[1, 2, 6, 8], help='deck counts to time')
+    parser.add_argument('-n', '--hands', type=int, default=20000,
+                        help='operations per timing run')
+    parser.add_argument('--json', metavar='FILE',
+                        help='write the results to FILE as JSON')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='compare against results saved with --json')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown against the baseline, '
+                             'as a fraction')
+    parser.add_argument('--no-gui', action='store_true',
+                        help='skip the game window startup timing')
+    parser.add_argument('--reports', action='store_true',
+                        help='also print the comparison reports')
+    args = parser.parse_args(argv)
+
+    results = suite_engine(args.decks, args.hands)
+    results.update(suite_import())
+    if not args.no_gui:
+        gui = suite_gui()
+        if not gui:
+            print('GameWindow startup skipped, no display available')
+        results.update(gui)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    print('{0:<36} {1:>12} {2:>10}'.format('operation', 'usec/op',
+                                           'vs base'))
+    for name, seconds in sorted(results.items()):
+        change = ''
+        if baseline.get(name):
+            change = '{0:+.1%}'.format(seconds / baseline[name] - 1)
+        print('{0:<36} {1:>12.3f} {2:>10}'.format(name, seconds * 1e6,
+                                                   change))
+
+    if args.json:
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'hands': args.hands,
+            'results': results,
+        }
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2, sort_keys=True)
+
+    if args.reports:
+        bench_shuffle()
+        bench_batch()
+        bench_seats()
+        bench_allocations()
+        bench_profiles()
+        bench_scaling()
+        bench_exact()
+
+    regressions = []
+    if results['import.headless'] > HEADLESS_IMPORT_BUDGET:
+        regressions.append('import.headless (over {0:.0f} ms budget)'.format(
+            HEADLESS_IMPORT_BUDGET * 1000))
+    if baseline:
+        regressions += compare(results, baseline, args.threshold)
+    for name in regressions:
+        print('REGRESSION: {0}'.format(name))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
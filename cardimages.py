@@ -0,0 +1,76 @@
+"""This module loads the card pictures for the game window. Every face and
+the card back is decoded at most once and the same PhotoImage is handed to
+every label that shows it.
+"""
+__all__ = ['CardImages', 'card_filename']
+
+import os
+import time
+from tkinter import PhotoImage, TclError
+
+RANKS = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K')
+SUIT_LETTERS = ('C', 'D', 'H', 'S')  # Same order as cards.SUITS
+
+
+def card_filename(code):
+    """Return the image file name for a card code, e.g. KH.gif."""
+
+    return '{0}{1}.gif'.format(RANKS[code % 13], SUIT_LETTERS[code // 13])
+
+
+class CardImages(object):
+    """Cache of card images for one Tk window, keyed by card code.
+
+    Faces are read from one GIF per card in directory. Missing files give
+    None so the caller can fall back to text.
+    """
+
+    def __init__(self, master, directory='images', back='Blue_Back.gif'):
+        self.master = master
+        self.directory = directory
+        self.back_file = back
+        self.faces = {}       # PhotoImage per card code
+        self.back_image = None
+        self.load_time = 0.0  # Seconds spent reading and decoding images
+
+    def _load(self, filename):
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            return None
+
+        start = time.perf_counter()
+        try:
+            image = PhotoImage(master=self.master, file=path)
+        except TclError:
+            image = None
+        self.load_time += time.perf_counter() - start
+
+        return image
+
+    def face(self, code):
+        """Return the image for the face of a card code."""
+
+        if code not in self.faces:
+            self.faces[code] = self._load(card_filename(code))
+        return self.faces[code]
+
+    def back(self):
+        """Return the image for the back of a card."""
+
+        if self.back_image is None:
+            self.back_image = self._load(self.back_file)
+        return self.back_image
+
+    def image(self, card):
+        """Return the image to show for a PlayingCard as it lies."""
+
+        if card.face():
+            return self.face(card.code)
+        return self.back()
+
+    def preload(self):
+        """Load every face and the back now rather than on first use."""
+
+        for code in range(52):
+            self.face(code)
+        self.back()
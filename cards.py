@@ -1,11 +1,86 @@
 """This module holds classes for creating an object oriented deck
 of cards and the necessary methods for manipulating them
 """
-__all__ = ['PlayingCard', 'CardDeck']
+__all__ = ['PlayingCard', 'CardDeck', 'Blackjack', 'SUITS', 'NAMES',
+           'CARD_NAMES', 'CARD_SUITS', 'CARD_IDS', 'BLACKJACK_VALUES',
+           'BLACKJACK_PAYOUT', 'COUNT_SYSTEMS', 'MAX_SEATS', 'cut_card']
 
 import random
-from collections import deque
-from players import *
+import struct
+from array import array
+from itertools import islice
+from players import BlackjackDealer, BlackjackPlayer, HandPool
+from exact import ExactCalculator
+from profiling import Profiler
+
+SUITS = (
+    'Clubs',
+    'Diamonds',
+    'Hearts',
+    'Spades',
+)
+
+NAMES = (
+    'Ace',
+    'Two',
+    'Three',
+    'Four',
+    'Five',
+    'Six',
+    'Seven',
+    'Eight',
+    'Nine',
+    'Ten',
+    'Jack',
+    'Queen',
+    'King',
+)
+
+# Every card in a shoe is stored as a single byte code, [0-51], where
+# code = suit index * 13 + (id - 1). These tables turn a code back into
+# the attributes of a PlayingCard without any arithmetic.
+CARD_NAMES = tuple(NAMES[code % 13] for code in range(52))
+CARD_SUITS = tuple(SUITS[code // 13] for code in range(52))
+CARD_IDS = bytes(code % 13 + 1 for code in range(52))
+BLACKJACK_VALUES = bytes(min(code % 13 + 1, 10) for code in range(52))
+
+BLACKJACK_PAYOUT = 1.5  # A natural pays 3 to 2
+
+# Snapshot layouts. A deck is its header, 52 point values, 13 count tags,
+# 13 rank counts, the random generator state, then the card codes. A game
+# is its header, each seat's header followed by each of its hands, the
+# dealer's cards, the actions, then the deck snapshot.
+DECK_SNAPSHOT = struct.Struct('<4sBBHHHI?i')  # magic, version, decks,
+                                             # position, cut, round start,
+                                             # shuffles, continuous, count
+RANK_COUNTS = struct.Struct('<13H')
+RNG_STATE = struct.Struct('<B625I?d')       # version, state, gauss
+GAME_SNAPSHOT = struct.Struct('<4sBBB?????BBBB')  # magic, version, decks,
+                                            # shuffle, rules, most hands,
+                                            # seats, dealer card and action
+                                            # counts
+SEAT_SNAPSHOT = struct.Struct('<ddddBB')    # money, bet, highest win and
+                                            # loss, hand count, hand in play
+HAND_SNAPSHOT = struct.Struct('<dBB')       # bet, flags, card count
+SNAPSHOT_VERSION = 4
+MAX_SEATS = 7
+
+# Card counting tags for each id, Ace through King
+COUNT_SYSTEMS = {
+    'hi-lo': (-1, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1),
+    'hi-opt-i': (0, 0, 1, 1, 1, 1, 0, 0, 0, -1, -1, -1, -1),
+    'ko': (-1, 1, 1, 1, 1, 1, 1, 0, 0, -1, -1, -1, -1),
+}
+
+def cut_card(total, percent_left):
+    """Return the index of the cut card in a shoe of total cards: the
+    position from which no more than percent_left percent of the shoe,
+    rounded down, is left to deal.
+    """
+
+    last_remaining = ((percent_left + 1) * total - 1) // 100
+    return max(0, total - last_remaining)
+
 
 class PlayingCard(object):
     """Contains the attributes of a single playing card and methods for
@@ -18,6 +93,7 @@ class PlayingCard(object):
         self.id = None       # Number identifier, [1-13]
         self.faceup = False  # Face up or down, boolean value
         self.value = None    # Point value within a game
+        self.code = None     # Compact card code within a shoe, [0-51]
 
     def __add__(self, other):
         return self.value + other
@@ -82,139 +158,379 @@ class PlayingCard(object):
 
 
 class CardDeck(object):
-    """Contains 52 or more playing cards and the methods for using them."""     
+    """Contains 52 or more playing cards and the methods for using them.
+
+    The shoe is kept as an array of card codes. PlayingCard objects are only
+    built when a card is drawn or otherwise requested by the caller. Pass a
+    random.Random instance as rng for a reproducible shoe, otherwise the
+    random module's shared generator is used.
+
+    The deck keeps the count of every rank left and a running count under
+    a card counting system, both updated as cards are drawn.
+
+    The cut card sits where percent_left percent of the shoe is left. If a
+    round runs past the end of the shoe anyway, the discards from earlier
+    rounds are shuffled and dealt from, as a dealer would. With
+    continuous set the deck acts as a continuous shuffling machine instead:
+    each draw picks uniformly from the cards left and collect() returns the
+    dealt cards, so the shoe never needs a full shuffle.
+    """
 
-    def __init__(self, decks=1):
-        self.deck = deque()
+    def __init__(self, decks=1, values=None, rng=None, count_system='hi-lo',
+                 percent_left=25, continuous=False):
+        self.rng = random if rng is None else rng
         self.deck_count = int(decks)
-        self.shuffle_count = self.deck_count * 7
-
-        self.suits = (
-            'Clubs',
-            'Diamonds',
-            'Hearts',
-            'Spades',
-        )
-
-        self.names = (
-            'Ace',
-            'Two',
-            'Three',
-            'Four',
-            'Five',
-            'Six',
-            'Seven',
-            'Eight',
-            'Nine',
-            'Ten',
-            'Jack',
-            'Queen',
-            'King',
-        )
+        self.deck = array('b', range(52)) * self.deck_count  # Card codes
+        self.position = 0  # Index of the next card to be drawn
+        self.shuffles = 0  # Times the shoe has been shuffled
+        self.continuous = continuous
+        self.set_cut(percent_left)
+
+        if values is None:
+            values = CARD_IDS   # Point value of each code, default is id
+        self.values = bytes(values)
+
+        self.suits = SUITS
+        self.names = NAMES
+
+        self.rank_counts = [0] * 14  # Cards left per id, index 0 unused
+        self.running_count = 0
+        self.set_count_system(count_system)
 
         self.shuffle()
 
     def __len__(self):
-        return len(self.deck)
+        return len(self.deck) - self.position
 
     def __iter__(self):
-        return iter(self.deck)
+        return map(self.card, islice(self.deck, self.position, None))
 
     def __getitem__(self, index):
-        return self.deck[index]
-        
+        remaining = len(self)
+        if index < 0:
+            index += remaining
+        if not 0 <= index < remaining:
+            raise IndexError('deck index out of range')
+
+        return self.card(self.deck[self.position + index])
+
+    def card(self, code):
+        """Build a PlayingCard for the given card code."""
+
+        card = PlayingCard()
+        card.set_attributes(CARD_NAMES[code], CARD_SUITS[code], CARD_IDS[code])
+        card.assign_value(self.values[code])
+        card.code = code
+
+        return card
+
+    def set_cut(self, percent_left):
+        """Place the cut card so the shoe is due for a shuffle once no more
+        than percent_left percent of it is left.
+        """
+
+        self.cut = cut_card(len(self.deck), percent_left)
+
+    def needs_shuffle(self):
+        """Return True once the cut card has been reached."""
+
+        return self.position >= self.cut and not self.continuous
+
+    def collect(self):
+        """Return every dealt card to a continuous shuffling machine."""
+
+        self.position = 0
+        self.round_start = 0
+        self.rank_counts[1:] = [4 * self.deck_count] * 13
+        self.running_count = 0
+
+    def start_round(self):
+        """Mark the cards drawn from here on as in play, so a shoe that
+        runs out this round only reshuffles the cards drawn before.
+        """
+
+        self.round_start = self.position
+
+    def reshuffle_discards(self):
+        """Shuffle the discards of earlier rounds back in behind the cards
+        in play, for a shoe that ran out in the middle of a round.
+        """
+
+        deck = self.deck
+        start = self.round_start
+        if not start:
+            raise IndexError('draw from an empty deck')
+
+        in_play = deck[start:]
+        discards = deck[:start]
+        self.rng.shuffle(discards)
+        deck[:] = in_play + discards
+        self.position = len(in_play)
+        self.round_start = 0
+        self.shuffles += 1
+
+        # Count the new shoe as though the cards in play just came out
+        self.rank_counts[1:] = [4 * self.deck_count] * 13
+        self.running_count = 0
+        for code in in_play:
+            self.rank_counts[CARD_IDS[code]] -= 1
+            self.running_count += self.count_tags[code]
+
     def shuffle(self):
-        """Initialize the deck with 52 or more cards."""
+        """Return every dealt card to the shoe and shuffle it in place.
 
-        if self.deck:
-            self.deck = deque()
+        Drawn cards are never removed from the array, only passed over, so
+        the whole shoe is already contiguous and a single Fisher-Yates pass
+        gives a uniform ordering without rebuilding any cards.
+        """
 
-        max_decks = self.deck_count + 1  # +1 for range function
+        self.position = 0
+        self.round_start = 0
+        self.shuffles += 1
+        self.rng.shuffle(self.deck)
 
-        for deck in range(1, max_decks):
-            for suit in self.suits:
-                for num, name in enumerate(self.names, start=1):
-                    card = PlayingCard()
-                    card.set_attributes(name, suit, num)
-                    self.deck.append(card)
+        self.rank_counts[1:] = [4 * self.deck_count] * 13
+        self.running_count = 0
+
+    def reset(self, rng=None):
+        """Put the cards back in new deck order and shuffle, switching to
+        rng first when one is given. The shoe then depends only on the
+        generator's state, so equally seeded decks deal the same cards.
+        """
+
+        if rng is not None:
+            self.rng = rng
+        self.deck[:] = array('b', range(52)) * self.deck_count
+        self.shuffle()
+
+    def set_count_system(self, system):
+        """Count cards with a system from COUNT_SYSTEMS, or any sequence of
+        13 tags for Ace through King. The running count is recalculated
+        from the cards already drawn.
+        """
+
+        if isinstance(system, str):
+            system = COUNT_SYSTEMS[system]
+        if len(system) != 13:
+            raise ValueError('a count system needs 13 tags')
+
+        self.count_tags = tuple(system[CARD_IDS[code] - 1]
+                                for code in range(52))
+        self.running_count = sum(self.count_tags[code] for code in
+                                 islice(self.deck, 0, self.position))
+
+    def remaining(self, id_no):
+        """Return how many cards of the id, [1-13], are left in the deck."""
+
+        return self.rank_counts[id_no]
+
+    def true_count(self):
+        """Return the running count divided by the decks left to deal."""
+
+        decks_left = len(self) / 52
+        if not decks_left:
+            return 0.0
+        return self.running_count / decks_left
+
+    def value_counts(self):
+        """Return a list of the cards left in the deck for each point
+        value, indexed by value with index 0 unused.
+        """
+
+        counts = [0] * 11
+        values = self.values
+        rank_counts = self.rank_counts
+        for id_no in range(1, 14):
+            counts[values[id_no - 1]] += rank_counts[id_no]
+
+        return counts
+
+    def snapshot(self):
+        """Return the complete state of the deck as bytes: card order,
+        position, counts and the random generator state.
+        """
+
+        version, state, gauss = self.rng.getstate()
+        return b''.join((
+            DECK_SNAPSHOT.pack(b'BJDK', SNAPSHOT_VERSION, self.deck_count,
+                               self.position, self.cut, self.round_start,
+                               self.shuffles,
+                               self.continuous, self.running_count),
+            self.values,
+            struct.pack('<13b', *(self.count_tags[code]
+                                  for code in range(13))),
+            RANK_COUNTS.pack(*self.rank_counts[1:]),
+            RNG_STATE.pack(version, *state, gauss is not None, gauss or 0.0),
+            self.deck.tobytes(),
+        ))
+
+    def restore(self, data):
+        """Put the deck back in the state saved by snapshot()."""
+
+        (magic, version, decks, position, cut, round_start, shuffles,
+         continuous, count) = DECK_SNAPSHOT.unpack_from(data)
+        if magic != b'BJDK' or version != SNAPSHOT_VERSION:
+            raise ValueError('not a deck snapshot')
+        offset = DECK_SNAPSHOT.size
+
+        self.values = bytes(data[offset:offset + 52])
+        offset += 52
+        self.set_count_system(struct.unpack_from('<13b', data, offset))
+        offset += 13
+        self.rank_counts[1:] = RANK_COUNTS.unpack_from(data, offset)
+        offset += RANK_COUNTS.size
+        state = RNG_STATE.unpack_from(data, offset)
+        offset += RNG_STATE.size
+        self.rng.setstate((state[0], state[1:626],
+                           state[627] if state[626] else None))
+
+        self.deck_count = decks
+        self.deck = array('b', bytes(data[offset:offset + 52 * decks]))
+        self.position = position
+        self.cut = cut
+        self.round_start = round_start
+        self.shuffles = shuffles
+        self.continuous = continuous
+        self.running_count = count
+
+    def draw_code(self):
+        """Remove the first card from the deck and return its code."""
+
+        position = self.position
+        deck = self.deck
+        if position >= len(deck):  # Ran out mid round
+            self.reshuffle_discards()
+            position = self.position
+
+        if self.continuous:  # Swap a random card left into place
+            index = self.rng.randrange(position, len(deck))
+            deck[position], deck[index] = deck[index], deck[position]
+
+        code = deck[position]
+        self.position = position + 1
+        self.rank_counts[CARD_IDS[code]] -= 1
+        self.running_count += self.count_tags[code]
+
+        return code
 
-        for deck_shuffle in range(self.shuffle_count):
-            random.shuffle(self.deck)
-        
     def draw(self):
         """Remove the first card from the deck and return it."""
 
-        return self.deck.popleft()
+        return self.card(self.draw_code())
+
+
+def _card_bytes(hand):
+    """Return a hand's card codes as bytes, with 0x80 set on face up cards."""
+
+    return bytes(card.code | (0x80 if card.face() else 0) for card in hand)
 
 
 class Blackjack:
-    """Game logic for the card game Blackjack"""
+    """Game logic for the card game Blackjack
+
+    Up to MAX_SEATS players sit at the table and share the shoe. They are
+    kept in self.players in dealing order, and self.player is the first.
+
+    A pair may be split into at most max_hands hands. Split Aces take one
+    card each unless hit_split_aces is set, and are split again only when
+    resplit_aces is set.
+    """
+
+    def __init__(self, bet, decks=2, shuffle=25, debug=False, rng=None,
+                 hit_soft_17=False, double_after_split=True, surrender=False,
+                 continuous=False, seats=1, max_hands=4, resplit_aces=False,
+                 hit_split_aces=False):
+        if not 1 <= seats <= MAX_SEATS:
+            raise ValueError('a table has 1 to {0} seats'.format(MAX_SEATS))
 
-    def __init__(self, bet, decks=2, shuffle=25, debug=False):
         self.deck_count = decks  # Number of card decks in the game deck
         self.shuffle = shuffle   # Percent of deck left for shuffle threshold
+        self.hit_soft_17 = hit_soft_17  # Dealer hits a soft 17
+        self.double_after_split = double_after_split
+        self.surrender = surrender      # Late surrender is offered
+        self.max_hands = max_hands      # Most hands a player can split to
+        self.resplit_aces = resplit_aces
+        self.hit_split_aces = hit_split_aces
         self.player_bet = bet
-        self.verbose = debug
 
-        self.deck = CardDeck(decks=self.deck_count)
-        self._assign_values()
+        self.deck = CardDeck(decks=self.deck_count, values=BLACKJACK_VALUES,
+                             rng=rng, percent_left=shuffle,
+                             continuous=continuous)
         self.card_total = len(self.deck)
         
-        self.player = BlackjackPlayer()
+        self.players = [BlackjackPlayer() for seat in range(seats)]
+        for seat, player in enumerate(self.players[1:], 2):
+            player.name = 'Seat {0}'.format(seat)
+        self.player = self.players[0]
         self.dealer = BlackjackDealer()
+        for player in self.players:
+            player.set_bet(self.player_bet)
+        self.pool = HandPool()      # Spare hands for splits
+        self.dealer_played = False  # The dealer drew out the last round
+        self.actions = bytearray()  # First seat's action letters this round
 
-    def _assign_values(self):
-        for card in self.deck:
-            if card.id > 9:
-                card.assign_value(10)
-            else:
-                card.assign_value(card.id)
+        self.profiler = None
+        if debug:  # Time every hot operation and report once a minute
+            self.profiler = Profiler(dump_every=60)
+            self.profiler.instrument(self)
+
+        self.calculator = ExactCalculator(hit_soft_17=hit_soft_17)
+        self._calculator_shuffles = self.deck.shuffles
 
     def _shuffle_time(self):
-        """Check if it is time to shuffle the deck by calculating the
-        percentage of the cards remaining in the deck
+        """Check if it is time to shuffle the deck, which is once the cut
+        card placed at the shuffle percentage has come out.
         """
 
-        remaining = len(self.deck)  # Current count of cards in the deck
-        percentage_left = int((remaining / self.card_total) * 100)
+        return self.deck.needs_shuffle()
+
+    def prepare_shoe(self):
+        """Get the shoe ready for the next round, shuffling it if the cut
+        card has come out or collecting the last round's cards back into a
+        continuous shuffling machine. Return True if the shoe was shuffled.
+        """
+
+        if self.deck.continuous:
+            self.deck.collect()
+        elif self._shuffle_time():
+            self.deck.shuffle()
+            return True
+        return False
 
-        if ( percentage_left > 25 ):
-            return False  # It isn't time to shuffle
-        else:
-            return True   # Or maybe it is
-        
     def deal(self):
-        """Deal out a new hand of cards to the dealer and player."""
+        """Deal out a new hand of cards in casino order: a face up card to
+        every seat, the dealer's upcard, a second card to every seat, then
+        the dealer's face down hole card.
+        """
+
+        self.prepare_shoe()
+        self.deck.start_round()
+        self.actions.clear()
 
         if self.dealer:  # Has cards in hand
             self.dealer.reset()
 
-        if self.player:  # Has cards in hand
-            self.player.reset()
-
-        dealer_first = self.deck.draw()
-        dealer_second = self.deck.draw()
-        dealer_second.flip()
-        self.dealer.take_card(dealer_first)
-        self.dealer.take_card(dealer_second)
-
-        player_first = self.deck.draw()
-        player_second = self.deck.draw()
-        player_first.flip()
-        player_second.flip()
-        self.player.take_card(player_first)
-        self.player.take_card(player_second)
-
-        if self.verbose:
-            print('Player bets:', self.player_bet)
-            for player in (self.player, self.dealer):
-                print(player, 'dealt:')
-                for card in player:
-                    if card.face():
-                        print(' '*3, str(card)+':', 'face up')
-                    else:
-                        print(' '*3, str(card)+':', 'face down')
-            
+        players = self.players
+        pool = self.pool
+        for player in players:
+            player.reset(pool)
+            player.hand.bet = player.current_bet
+
+        draw = self.deck.draw
+        for player in players:
+            card = draw()
+            card.flip()
+            player.take_card(card)
+        upcard = draw()
+        upcard.flip()
+        self.dealer.take_card(upcard)
+
+        for player in players:
+            card = draw()
+            card.flip()
+            player.take_card(card)
+        self.dealer.take_card(draw())  # Hole card stays face down
+
     def check_hand(self, player):
         """Check point value of the hand of cards and act appropriately."""
 
@@ -226,22 +542,349 @@ class Blackjack:
         else:
             status = 'okay'
 
-        if self.verbose:
-            print(total, 'points')
-            
         return status
     
+    def can_hit(self, player):
+        """Return True if the hand in play may take another card, which
+        split Aces may not unless hit_split_aces is set.
+        """
+
+        hand = player.hand
+        return not hand.done and not (hand.split and
+                                      hand.cards[0].id == 1 and
+                                      not self.hit_split_aces)
+
     def hit(self, player):
         """Retrieve a face up card from the deck, and add it to a hand."""
 
+        if not self.can_hit(player):
+            raise ValueError('this hand cannot take a card')
+
         hit_card = self.deck.draw()
         hit_card.flip()
         player.take_card(hit_card)
+        if player is self.player:
+            self.actions.append(ord('H'))
+
+    def stay(self, player=None):
+        """End the hand in play for a player, the first seat's by default.
+        Return True if the player has another split hand to play, which is
+        dealt its second card, or False once the player's turn is over.
+        """
+
+        if player is None:
+            player = self.player
+        if player is self.player:
+            self.actions.append(ord('S'))
+
+        hand = player.hand
+        hand.done = True
+        hands = player.hands
+        index = hands.index(hand) + 1
+        if index == len(hands):
+            return False
+
+        hand = player.hand = hands[index]
+        self._deal_split(player, hand)
+        return True
+
+    def _act(self, player, letter):
+        """Record an action letter, e.g. 'D' for double, for the first seat."""
+
+        if player is self.player:
+            self.actions.append(ord(letter))
+
+    def _deal_split(self, player, hand):
+        """Give a split hand its second card, ending split Aces there
+        unless the rules let them take more cards or split again.
+        """
+
+        card = self.deck.draw()
+        card.flip()
+        hand.take_card(card)
+        if (hand.cards[0].id == 1 and not self.hit_split_aces and
+                not self.can_split(player)):
+            hand.done = True
+
+    def can_double(self, player):
+        """Return True if the hand in play may double down."""
+
+        hand = player.hand
+        return (not hand.done and len(hand.cards) == 2 and
+                (self.double_after_split or not hand.split))
+
+    def double(self, player):
+        """Double the bet on the hand in play and deal it one last card."""
+
+        if not self.can_double(player):
+            raise ValueError('this hand cannot double down')
+
+        hand = player.hand
+        hand.bet *= 2
+        hand.doubled = True
+        card = self.deck.draw()
+        card.flip()
+        hand.take_card(card)
+        hand.done = True
+        self._act(player, 'D')
+
+    def can_split(self, player):
+        """Return True if the hand in play is a pair that may be split."""
+
+        hand = player.hand
+        return (not hand.done and hand.is_pair() and
+                len(player.hands) < self.max_hands and
+                not (hand.split and hand.cards[0].id == 1 and
+                     not self.resplit_aces))
+
+    def split(self, player):
+        """Split the pair in play into two hands, each carrying the bet.
+        The first is dealt its second card now and the new hand when play
+        reaches it, see stay().
+        """
+
+        if not self.can_split(player):
+            raise ValueError('this hand cannot be split')
+
+        hand = player.hand
+        new_hand = self.pool.acquire()
+        new_hand.bet = hand.bet
+        hand.split = new_hand.split = True
+        new_hand.take_card(hand.split_card())
+        hands = player.hands
+        hands.insert(hands.index(hand) + 1, new_hand)
+        self._act(player, 'P')
+        self._deal_split(player, hand)
+
+    def can_surrender(self, player):
+        """Return True if the player may give up the first two cards."""
+
+        hand = player.hand
+        return (self.surrender and not hand.done and
+                len(player.hands) == 1 and len(hand.cards) == 2)
+
+    def surrender_hand(self, player):
+        """Give up the hand in play for half of its bet back."""
 
-        if self.verbose:
-            print(player, 'receives', hit_card)
+        if not self.can_surrender(player):
+            raise ValueError('this hand cannot surrender')
 
-    def stay(self):
-        """End the player's turn and pass control to the dealer."""
+        hand = player.hand
+        hand.surrendered = True
+        hand.done = True
+        self._act(player, 'R')
+
+    def dealer_upcard(self):
+        """Return the dealer's face up card."""
+
+        for card in self.dealer:
+            if card.face():
+                return card
+
+    def dealer_play(self):
+        """Turn the dealer's hole card face up and hit until reaching 17,
+        or a hard 17 when the dealer hits soft 17.
+        """
+
+        for card in self.dealer:
+            if not card.face():
+                card.flip()
+
+        while True:
+            total = self.dealer.score()
+            if total > 17 or (total == 17 and not
+                              (self.hit_soft_17 and self.dealer.is_soft())):
+                break
+            self.hit(self.dealer)
+
+    def finish_round(self):
+        """Play the dealer's hand if any hand at the table is still live,
+        then settle every hand and return the outcomes in seat order.
+        """
+
+        dealer = self.dealer
+        players = self.players
+        live = False
+        if not dealer.is_blackjack():
+            for player in players:
+                for hand in player.hands:
+                    if not (hand.is_bust() or hand.surrendered or
+                            hand.is_blackjack()):
+                        live = True
+
+        self.dealer_played = live
+        if live:
+            self.dealer_play()
+        else:
+            for card in dealer:
+                if not card.face():
+                    card.flip()
+
+        return [self.settle(player, hand)
+                for player in players for hand in player.hands]
+
+    def snapshot(self):
+        """Return the complete state of the game as bytes: the shoe, the
+        cards in every hand, each seat's money and the table rules.
+        """
+
+        parts = [GAME_SNAPSHOT.pack(b'BJGM', SNAPSHOT_VERSION,
+                                    self.deck_count, self.shuffle,
+                                    self.hit_soft_17,
+                                    self.double_after_split, self.surrender,
+                                    self.resplit_aces, self.hit_split_aces,
+                                    self.max_hands, len(self.players),
+                                    len(self.dealer), len(self.actions))]
+        for player in self.players:
+            parts.append(SEAT_SNAPSHOT.pack(player.money, player.current_bet,
+                                            player.highest_win,
+                                            player.highest_loss,
+                                            len(player.hands),
+                                            player.hands.index(player.hand)))
+            for hand in player.hands:
+                parts.append(HAND_SNAPSHOT.pack(hand.bet, hand.flags(),
+                                                len(hand)))
+                parts.append(_card_bytes(hand))
+        parts.append(_card_bytes(self.dealer))
+        parts.append(bytes(self.actions))
+        parts.append(self.deck.snapshot())
+
+        return b''.join(parts)
+
+    def restore(self, data):
+        """Put the game back in the state saved by snapshot(). Only the
+        cards in the hands are rebuilt as PlayingCard objects.
+        """
+
+        (magic, version, decks, shuffle, hit_soft_17, double_after_split,
+         surrender, resplit_aces, hit_split_aces, max_hands, seats,
+         dealer_count, action_count) = GAME_SNAPSHOT.unpack_from(data)
+        if magic != b'BJGM' or version != SNAPSHOT_VERSION:
+            raise ValueError('not a game snapshot')
+        offset = GAME_SNAPSHOT.size
+
+        self.deck_count = decks
+        self.shuffle = shuffle
+        self.hit_soft_17 = hit_soft_17
+        self.double_after_split = double_after_split
+        self.surrender = surrender
+        self.resplit_aces = resplit_aces
+        self.hit_split_aces = hit_split_aces
+        self.max_hands = max_hands
+
+        while len(self.players) < seats:
+            self.players.append(BlackjackPlayer(
+                'Seat {0}'.format(len(self.players) + 1)))
+        del self.players[seats:]
+
+        for player in self.players:
+            (player.money, player.current_bet, player.highest_win,
+             player.highest_loss, hand_count,
+             in_play) = SEAT_SNAPSHOT.unpack_from(data, offset)
+            offset += SEAT_SNAPSHOT.size
+            player.reset(self.pool)
+            for index in range(hand_count):
+                if index:
+                    player.hands.append(self.pool.acquire())
+                hand = player.hands[index]
+                bet, flags, count = HAND_SNAPSHOT.unpack_from(data, offset)
+                offset += HAND_SNAPSHOT.size
+                self._restore_cards(hand, data[offset:offset + count])
+                offset += count
+                hand.bet = bet
+                hand.set_flags(flags)
+            player.hand = player.hands[in_play]
+
+        self.dealer.reset()
+        self._restore_cards(self.dealer.hand,
+                            data[offset:offset + dealer_count])
+        offset += dealer_count
+
+        self.actions[:] = data[offset:offset + action_count]
+        offset += action_count
+
+        self.deck.restore(data[offset:])
+        self.card_total = len(self.deck.deck)
+        self.calculator = ExactCalculator(hit_soft_17=hit_soft_17)
+        self._calculator_shuffles = self.deck.shuffles
+
+    def _restore_cards(self, hand, data):
+        """Fill an empty hand from the card bytes written by _card_bytes."""
+
+        for byte in data:
+            card = self.deck.card(byte & 0x7f)
+            if byte & 0x80:
+                card.flip()
+            hand.take_card(card)
+
+    def expected_values(self, player=None):
+        """Return the exact EV, in bets, of 'hit', 'stand' and 'double' for
+        the player's hand against the dealer's upcard, given the cards that
+        have not been seen. Results are cached until the shoe is shuffled.
+        """
+
+        if player is None:
+            player = self.player
+
+        if self._calculator_shuffles != self.deck.shuffles:
+            self.calculator.clear()
+            self._calculator_shuffles = self.deck.shuffles
+
+        counts = self.deck.value_counts()
+        for card in self.dealer:
+            if not card.face():  # The hole card is still unseen
+                counts[card.value] += 1
+
+        return self.calculator.evaluate(counts, player.hard_total,
+                                        player.has_ace,
+                                        self.dealer_upcard().value)
+
+    def settle(self, player, hand=None):
+        """Pay out or collect the bet on one of the player's hands, the hand
+        in play by default, and return the outcome, one of 'blackjack',
+        'win', 'push', 'lose' or 'surrender'. The outcome and the money won
+        or lost are also kept on the hand.
+        """
+
+        if hand is None:
+            hand = player.hand
+        bet = hand.bet
+        hand_total = hand.score()
+        dealer_total = self.dealer.score()
+
+        if hand.surrendered:
+            outcome = 'surrender'
+        elif hand.is_bust():
+            outcome = 'lose'
+        elif hand.is_blackjack():
+            if self.dealer.is_blackjack():
+                outcome = 'push'
+            else:
+                outcome = 'blackjack'
+        elif self.dealer.is_blackjack():
+            outcome = 'lose'
+        elif self.dealer.is_bust() or hand_total > dealer_total:
+            outcome = 'win'
+        elif hand_total == dealer_total:
+            outcome = 'push'
+        else:
+            outcome = 'lose'
+
+        if outcome == 'blackjack':
+            net = bet * BLACKJACK_PAYOUT
+            player.winner(net)
+        elif outcome == 'win':
+            net = bet
+            player.winner(net)
+        elif outcome == 'lose':
+            net = -bet
+            player.loser(bet)
+        elif outcome == 'surrender':
+            net = -bet / 2
+            player.loser(bet / 2)
+        else:
+            net = 0
 
-        pass
+        hand.outcome = outcome
+        hand.net = net
+        return outcome
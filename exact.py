@@ -0,0 +1,289 @@
+"""This module computes the exact expected value of hitting, standing and
+doubling for the cards actually left in a shoe.
+
+Which sets of cards the dealer can draw from an upcard, and in how many
+orders, does not depend on the shoe at all; only the chance of drawing
+each set does. Those draw tables are built once per upcard and kept from
+hand to hand until the shoe is shuffled, so a later hand's dealer odds
+cost one pass over a table instead of a fresh recursion. Dealer odds and
+player decisions are also memoized on the remaining point value counts,
+which a decision reaches many times through different orders of the
+same cards.
+
+An ExactCalculator made with approximate_above trades exactness for
+speed in big shoes: once more than that many cards are left, the dealer's
+outcomes are worked out once per decision and shared by every total the
+player can draw to, ignoring how the player's own draws change them.
+Standing stays exact; hitting and doubling are then approximate.
+"""
+__all__ = ['ExactCalculator', 'pack_counts']
+
+from functools import lru_cache
+
+# The remaining count of each point value is packed into one integer,
+# SHIFT bits per value, which hashes far faster than a tuple of counts.
+SHIFT = 9
+MASK = (1 << SHIFT) - 1
+UNIT = tuple(1 << (SHIFT * value) for value in range(11))
+
+MAX_DRAWS = 22  # More cards than any dealer hand can draw
+
+# Most cards of each point value a dealer hand can draw, index 0 unused
+MOST_DRAWN = (0, 11, 8, 5, 4, 3, 3, 3, 2, 2, 2)
+
+# With this upcard the dealer has checked the hole card is not this value
+NATURAL_HOLE_CARD = {1: 10, 10: 1}
+
+
+def pack_counts(counts):
+    """Pack 11 point value counts, index 0 unused, into a single key."""
+
+    key = 0
+    for value in range(1, 11):
+        key += counts[value] * UNIT[value]
+    return key
+
+
+def _score(hard, ace):
+    if ace and hard <= 11:
+        return hard + 10
+    return hard
+
+
+def _dealer_steps(hit_soft_17):
+    """Build a table, indexed [ace][hard][value], of what happens when the
+    dealer draws a card of the value. Each entry is (result, hard, ace)
+    for the new hand, where result is 0 to 4 for standing on 17 to 21, 5
+    for a bust and -1 when the dealer must draw again.
+    """
+
+    steps = ([], [])
+    for ace in (False, True):
+        for hard in range(22):
+            row = [None]
+            for value in range(1, 11):
+                next_hard = hard + value
+                next_ace = ace or value == 1
+                total = _score(next_hard, next_ace)
+                soft = next_ace and next_hard <= 11
+                if next_hard > 21:
+                    result = 5
+                elif total > 17 or (total == 17 and not
+                                    (hit_soft_17 and soft)):
+                    result = total - 17
+                else:
+                    result = -1
+                row.append((result, next_hard, next_ace))
+            steps[ace].append(row)
+    return steps
+
+
+def _draw_table(steps, upcard):
+    """Return the draw table of an upcard: for each finish, standing on 17
+    to 21 then busting, a list of (cards drawn, orders, factorial indexes)
+    for every set of cards the dealer can draw to that finish. orders is
+    how many orders of the set the dealer's rules allow, never starting
+    with the hole card that would have made a natural, and the indexes
+    pick each value's falling factorial out of the table built in
+    ExactCalculator._dealer_upcard_uncached().
+    """
+
+    excluded = NATURAL_HOLE_CARD.get(upcard)
+    sets = {}  # Cards drawn per value to [finish, cards drawn, orders]
+    drawn = [0] * 11
+
+    def walk(hard, ace, first):
+        for value in range(1, 11):
+            if first and value == excluded:
+                continue
+            result, next_hard, next_ace = steps[ace][hard][value]
+            drawn[value] += 1
+            if result < 0:
+                walk(next_hard, next_ace, False)
+            else:
+                entry = sets.setdefault(tuple(drawn),
+                                        [result, sum(drawn), 0])
+                entry[2] += 1
+            drawn[value] -= 1
+
+    walk(upcard, upcard == 1, True)
+
+    table = [[] for finish in range(6)]
+    for counts, (result, total, orders) in sets.items():
+        indexes = tuple(value * MAX_DRAWS + count
+                        for value, count in enumerate(counts) if count)
+        table[result].append((total, float(orders), indexes))
+    return table
+
+
+class ExactCalculator(object):
+    """Composition dependent expected values for one shoe.
+
+    counts are the cards not yet seen by the player, as 11 point value
+    counts with index 0 unused, see CardDeck.value_counts().
+
+    Every result is exact unless approximate_above is given, see the
+    module docstring.
+    """
+
+    def __init__(self, hit_soft_17=False, maxsize=200000,
+                 approximate_above=None):
+        self.hit_soft_17 = hit_soft_17
+        self.maxsize = maxsize
+        self.approximate_above = approximate_above
+        self._draw_table = lru_cache(10)(self._draw_table_uncached)
+        self._dealer_upcard = lru_cache(maxsize)(
+            self._dealer_upcard_uncached)
+        self._best = lru_cache(maxsize)(self._best_uncached)
+        self._steps = _dealer_steps(hit_soft_17)
+
+    def clear(self):
+        """Drop every cached result, for use when the shoe is shuffled."""
+
+        self._draw_table.cache_clear()
+        self._dealer_upcard.cache_clear()
+        self._best.cache_clear()
+
+    def cache_info(self):
+        """Return the hit and miss counts of every cache as a dict."""
+
+        info = {}
+        for name in ('_draw_table', '_dealer_upcard', '_best'):
+            stats = getattr(self, name).cache_info()
+            info[name.strip('_')] = {
+                'hits': stats.hits,
+                'misses': stats.misses,
+                'size': stats.currsize,
+            }
+        return info
+
+    def _draw_table_uncached(self, upcard):
+        """Group every order in which the dealer can draw out a hand from
+        the upcard by the cards drawn, see _draw_table().
+        """
+
+        return _draw_table(self._steps, upcard)
+
+    def _dealer_upcard_uncached(self, key, remaining, upcard):
+        """Dealer outcomes for an upcard, given the dealer has checked for
+        a natural and does not have one.
+
+        The chance of drawing a set of cards in a given order is the
+        product of the falling factorials of the counts left of each value
+        in the set, over the falling factorial of the cards left, whatever
+        the order. Each finish is then a sum over the upcard's draw table.
+        """
+
+        # factorials[value * MAX_DRAWS + n] is count * (count - 1) * ...,
+        # n terms, for the count left of the value
+        factorials = [0.0] * (11 * MAX_DRAWS)
+        for value in range(1, 11):
+            count = (key >> (SHIFT * value)) & MASK
+            product = 1.0
+            start = value * MAX_DRAWS
+            for n in range(start, start + MOST_DRAWN[value] + 1):
+                factorials[n] = product
+                product *= count
+                count -= 1
+        inverse = [0.0] * MAX_DRAWS  # 1 / falling factorial of remaining
+        product = 1.0
+        for drawn in range(1, MAX_DRAWS):
+            product *= remaining - drawn + 1
+            if product <= 0:
+                break
+            inverse[drawn] = 1 / product
+
+        # No natural: the hole card is not the excluded value, which
+        # scales every order that does not start with it
+        scale = 1.0
+        excluded = NATURAL_HOLE_CARD.get(upcard)
+        if excluded:
+            left = remaining - ((key >> (SHIFT * excluded)) & MASK)
+            if not left:
+                return (0.0,) * 6
+            scale = remaining / left
+
+        outcomes = []
+        for finishes in self._draw_table(upcard):
+            total = 0.0
+            for drawn, orders, indexes in finishes:
+                chance = orders * inverse[drawn]
+                for index in indexes:
+                    chance *= factorials[index]
+                total += chance
+            outcomes.append(total * scale)
+        return tuple(outcomes)
+
+    def stand(self, key, remaining, total, upcard, dealer=None):
+        """EV of standing on a total, against the dealer outcomes given or
+        else those of the cards left.
+        """
+
+        if total > 21:
+            return -1.0
+
+        if dealer is None:
+            dealer = self._dealer_upcard(key, remaining, upcard)
+        ev = dealer[5]
+        for index in range(5):
+            if 17 + index < total:
+                ev += dealer[index]
+            elif 17 + index > total:
+                ev -= dealer[index]
+        return ev
+
+    def hit(self, key, remaining, hard, ace, upcard, dealer=None):
+        """EV of taking one card and then playing the better of hitting
+        and standing.
+        """
+
+        ev = 0.0
+        for value in range(1, 11):
+            count = (key >> (SHIFT * value)) & MASK
+            if not count:
+                continue
+            if hard + value > 21:
+                outcome = -1.0
+            else:
+                outcome = self._best(key - UNIT[value], remaining - 1,
+                                     hard + value, ace or value == 1, upcard,
+                                     dealer)
+            ev += count / remaining * outcome
+        return ev
+
+    def _best_uncached(self, key, remaining, hard, ace, upcard, dealer):
+        return max(self.stand(key, remaining, _score(hard, ace), upcard,
+                              dealer),
+                   self.hit(key, remaining, hard, ace, upcard, dealer))
+
+    def double(self, key, remaining, hard, ace, upcard, dealer=None):
+        """EV of doubling the bet and taking exactly one card."""
+
+        ev = 0.0
+        for value in range(1, 11):
+            count = (key >> (SHIFT * value)) & MASK
+            if not count:
+                continue
+            total = _score(hard + value, ace or value == 1)
+            ev += count / remaining * self.stand(key - UNIT[value],
+                                                 remaining - 1, total, upcard,
+                                                 dealer)
+        return 2 * ev
+
+    def evaluate(self, counts, hard, ace, upcard):
+        """Return a dict with the EV, in bets, of 'hit', 'stand' and
+        'double' for a hand with the given hard total and Ace flag.
+        """
+
+        key = pack_counts(counts)
+        remaining = sum(counts)
+        dealer = None
+        if (self.approximate_above is not None and
+                remaining > self.approximate_above):
+            dealer = self._dealer_upcard(key, remaining, upcard)
+        return {
+            'hit': self.hit(key, remaining, hard, ace, upcard, dealer),
+            'stand': self.stand(key, remaining, _score(hard, ace), upcard,
+                                dealer),
+            'double': self.double(key, remaining, hard, ace, upcard, dealer),
+        }
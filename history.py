@@ -0,0 +1,240 @@
+"""This module keeps an append-only log of played hands in fixed size
+binary records, and reads it back through a memory map so that very large
+logs can be iterated, indexed and filtered without loading or parsing
+them.
+
+Run ``python history.py FILE`` to summarize a log or ``python history.py
+FILE --replay`` to audit it.
+"""
+__all__ = ['HandRecord', 'HandHistoryWriter', 'HandHistory', 'replay',
+           'OUTCOMES']
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from cards import Blackjack
+
+# shoe id, hand id, bet, net, outcome, player card count, dealer card
+# count, action count, player codes, dealer codes, actions, Hand.flags(),
+# padding
+RECORD = struct.Struct('<IQIfBBBB11s11s11sB6x')
+MAX_CARDS = 11
+
+OUTCOMES = ('lose', 'push', 'win', 'blackjack', 'surrender')
+OUTCOME_CODES = {outcome: code for code, outcome in enumerate(OUTCOMES)}
+
+HandRecord = namedtuple('HandRecord', ['shoe', 'hand', 'bet', 'net',
+                                       'outcome', 'player', 'dealer',
+                                       'actions', 'flags'])
+
+
+def _decode(fields):
+    (shoe, hand, bet, net, outcome, player_count, dealer_count,
+     action_count, player, dealer, actions, flags) = fields
+    return HandRecord(shoe, hand, bet, net, OUTCOMES[outcome],
+                      tuple(player[:player_count]),
+                      tuple(dealer[:dealer_count]),
+                      actions[:action_count].decode('ascii'), flags)
+
+
+class HandHistoryWriter(object):
+    """Appends hand records to a log file, buffering them in memory and
+    writing in bulk every buffer_records hands.
+    """
+
+    def __init__(self, path, buffer_records=4096):
+        self.path = path
+        self.buffer_records = buffer_records
+        self.buffer = bytearray()
+        self.pending = 0
+        self.file = open(path, 'ab')
+        self.next_hand = self.file.tell() // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, shoe, bet, net, outcome, player, dealer, actions=b'',
+              flags=0):
+        """Append one hand given card codes, action letters and the flags
+        of the Hand.
+        """
+
+        if len(player) > MAX_CARDS or len(dealer) > MAX_CARDS:
+            raise ValueError('a hand can hold at most {0} cards'.format(
+                MAX_CARDS))
+        actions = bytes(actions)[:MAX_CARDS]
+        self.buffer += RECORD.pack(shoe, self.next_hand, bet, net,
+                                   OUTCOME_CODES[outcome], len(player),
+                                   len(dealer), len(actions), bytes(player),
+                                   bytes(dealer), actions, flags)
+        self.next_hand += 1
+        self.pending += 1
+        if self.pending >= self.buffer_records:
+            self.flush()
+
+    def record(self, game, outcome, net, player=None, hand=None):
+        """Append a hand just settled in a Blackjack game, by default the
+        first seat's hand in play. Only the first seat's actions are kept
+        by the game, and they cover all of its split hands.
+        """
+
+        if player is None:
+            player = game.player
+        if hand is None:
+            hand = player.hand
+        actions = game.actions if player is game.player else b''
+        self.write(game.deck.shuffles, int(hand.bet), net, outcome,
+                   [card.code for card in hand],
+                   [card.code for card in game.dealer], actions,
+                   hand.flags())
+
+    def flush(self):
+        """Write every buffered record to the file."""
+
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer = bytearray()
+            self.pending = 0
+
+    def close(self):
+        """Flush and close the log."""
+
+        self.flush()
+        self.file.close()
+
+
+class HandHistory(object):
+    """Read only, memory mapped view of a hand history log."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // RECORD.size
+        self.map = None
+        if self.count:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('hand index out of range')
+        return _decode(RECORD.unpack_from(self.map, index * RECORD.size))
+
+    def __iter__(self):
+        return map(_decode, self._raw())
+
+    def _raw(self):
+        """Yield the undecoded field tuples of every record."""
+
+        if not self.count:
+            return iter(())
+        view = memoryview(self.map)[:self.count * RECORD.size]
+        return RECORD.iter_unpack(view)
+
+    def filter(self, outcome=None, shoe=None, min_bet=None):
+        """Yield the records matching every given condition. Conditions are
+        tested on the raw fields so skipped records are never decoded.
+        """
+
+        code = None if outcome is None else OUTCOME_CODES[outcome]
+        for fields in self._raw():
+            if code is not None and fields[4] != code:
+                continue
+            if shoe is not None and fields[0] != shoe:
+                continue
+            if min_bet is not None and fields[2] < min_bet:
+                continue
+            yield _decode(fields)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+def replay(path, money=500, decks=2):
+    """Rebuild every logged hand in a Blackjack game, settle it again and
+    return (player, mismatches), where player carries the replayed money
+    and highest win and loss, and mismatches lists the hand ids whose
+    logged outcome or net disagrees with the replay.
+    """
+
+    game = Blackjack(0, decks=decks)
+    player = game.player
+    hand = player.hand
+    dealer = game.dealer
+    deck = game.deck
+    player.money = money
+    mismatches = []
+
+    with HandHistory(path) as log:
+        for fields in log._raw():
+            record = _decode(fields)
+            player.reset()
+            dealer.reset()
+            for code in record.player:
+                player.take_card(deck.card(code))
+            for code in record.dealer:
+                dealer.take_card(deck.card(code))
+            hand.bet = record.bet
+            hand.set_flags(record.flags)
+
+            before = player.money
+            outcome = game.settle(player)
+            if outcome != record.outcome or \
+                    player.money - before != record.net:
+                mismatches.append(record.hand)
+
+    return player, mismatches
+
+
+def main(argv=None):
+    """Command line entry point for summarizing or auditing a log."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Read a hand history log.')
+    parser.add_argument('log', help='hand history file')
+    parser.add_argument('--outcome', choices=OUTCOMES,
+                        help='only count hands with this outcome')
+    parser.add_argument('--replay', action='store_true',
+                        help='settle every hand again and report mismatches')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        player, mismatches = replay(args.log)
+        print('Replayed money: {0:.2f}'.format(player.money))
+        print('Highest win: {0}  Highest loss: {1}'.format(
+            player.highest_win, player.highest_loss))
+        print('Mismatched hands: {0}'.format(len(mismatches)))
+        return
+
+    with HandHistory(args.log) as log:
+        hands = 0
+        net = 0.0
+        for record in log.filter(outcome=args.outcome):
+            hands += 1
+            net += record.net
+        print('Hands: {0} of {1}  Net: {2:+.2f}'.format(hands, len(log), net))
+
+
+if __name__ == '__main__':
+    main()
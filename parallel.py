@@ -0,0 +1,122 @@
+"""This module splits a simulation across worker processes. The hands are
+cut into fixed size chunks and every chunk plays on its own shoe with a
+random generator seeded from the run seed and the chunk number, so a seed
+gives the same totals no matter how many workers share the chunks.
+"""
+__all__ = ['chunk_rng', 'run_parallel', 'print_progress']
+
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from simulation import SimulationResult, simulate
+
+
+def chunk_rng(seed, index):
+    """Return the random generator for one chunk of a seeded run."""
+
+    return random.Random('{0}:{1}'.format(seed, index))
+
+
+def _run_chunk(strategy, hands, seed, index, bet, decks, shuffle, betting,
+               continuous, seats):
+    return simulate(strategy, hands, bet=bet, decks=decks, shuffle=shuffle,
+                    rng=chunk_rng(seed, index), betting=betting,
+                    continuous=continuous, seats=seats)
+
+
+def print_progress(done, total):
+    """Progress callback that keeps a percentage on one line of stderr."""
+
+    sys.stderr.write('\r{0:6.1%} of {1} hands'.format(done / total, total))
+    if done == total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+def run_parallel(strategy, hands, seed=0, workers=None, chunk_size=10000,
+                 bet=5, decks=2, shuffle=25, betting=None, progress=None,
+                 continuous=False, seats=1, precision=None):
+    """Play hands rounds across worker processes and return the merged
+    SimulationResult.
+
+    strategy and betting must be picklable, a module level function or a
+    TrueCountSpread for example.
+    workers defaults to the number of CPUs, and 1 plays every chunk in this
+    process. progress, if given, is called as progress(done, total) each
+    time a chunk finishes.
+    precision, in bets, stops the run once the chunks merged so far, in
+    chunk order, put the EV per round within precision either side at 95%.
+    Chunks are only ever merged as a prefix, so a seed stops after the same
+    chunk with any number of workers.
+    """
+
+    chunks = []
+    for index, start in enumerate(range(0, hands, chunk_size)):
+        chunks.append((index, min(chunk_size, hands - start)))
+
+    results = [None] * len(chunks)
+    merged = SimulationResult()
+    merged_count = 0  # Chunks merged so far, always a prefix
+    done = 0
+    start = time.perf_counter()
+
+    def merge_ready():
+        nonlocal merged_count
+        while merged_count < len(chunks) and \
+                results[merged_count] is not None:
+            merged.merge(results[merged_count])
+            results[merged_count] = None
+            merged_count += 1
+            if precision is not None and merged.precise(precision):
+                return True
+        return merged_count == len(chunks)
+
+    if workers == 1:
+        for index, count in chunks:
+            results[index] = _run_chunk(strategy, count, seed, index, bet,
+                                        decks, shuffle, betting, continuous,
+                                        seats)
+            done += count
+            if progress:
+                progress(done, hands)
+            if merge_ready():
+                break
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            # With a precision keep only a window of chunks in flight, so
+            # little work is thrown away when the run stops early.
+            window = len(chunks)
+            if precision is not None:
+                window = 2 * (workers or os.cpu_count() or 1)
+            pending = {}
+            queued = iter(chunks)
+            finished = False
+            while not finished:
+                for index, count in queued:
+                    future = pool.submit(_run_chunk, strategy, count, seed,
+                                         index, bet, decks, shuffle, betting,
+                                         continuous, seats)
+                    pending[future] = index
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                ready, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in ready:
+                    index = pending.pop(future)
+                    results[index] = future.result()
+                    done += chunks[index][1]
+                    if progress:
+                        progress(done, hands)
+                finished = merge_ready()
+            for future in pending:
+                future.cancel()
+
+    if progress and done < hands:
+        progress(hands, hands)  # Stopped early, close the progress line
+    merged.elapsed = time.perf_counter() - start
+
+    return merged
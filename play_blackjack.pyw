@@ -1,11 +1,18 @@
-from cards import *
-from players import *
-from windows import *
+import os
+import sys
+
+# Player money and highs are kept here between games
+PROFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'profiles.db')
 
 def main():
+    from windows import GameWindow, NamePrompt  # Tk is only loaded here
+    from profiles import ProfileStore
+
     nameprompt = NamePrompt()
     playerid = nameprompt.player_id()
-    mainwindow = GameWindow(playerid)
+    with ProfileStore(PROFILES) as profiles:
+        mainwindow = GameWindow(playerid, profiles)
 
 if __name__ == '__main__':
     try:
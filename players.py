@@ -1,36 +1,212 @@
-__all__ = ['BlackjackDealer', 'BlackjackPlayer']
+__all__ = ['BlackjackDealer', 'BlackjackPlayer', 'Hand', 'HandPool',
+           'MINIMUM_BET', 'MAXIMUM_BET']
+
+MINIMUM_BET = 5     # Table limits
+MAXIMUM_BET = 5000
+
+
+class Hand(object):
+    """The cards of one hand with their running totals, the bet riding on
+    it and how it was played. Hands are reused round after round, see
+    HandPool.
+    """
+
+    __slots__ = ('cards', 'hard_total', 'has_ace', 'bet', 'split', 'doubled',
+                 'surrendered', 'done', 'outcome', 'net')
+
+    def __init__(self):
+        self.cards = list()
+        self.reset()
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __contains__(self, item):
+        return item in self.cards
+
+    def reset(self):
+        """Empty the hand for the next round."""
+
+        self.cards.clear()
+        self.hard_total = 0    # Point total counting every Ace as 1
+        self.has_ace = False   # True if an Ace could be counted as 11
+        self.bet = 0
+        self.split = False        # Made by splitting a pair
+        self.doubled = False
+        self.surrendered = False
+        self.done = False         # No more cards may be taken
+        self.outcome = None       # Set when the hand is settled
+        self.net = 0
+
+    def take_card(self, card):
+        """Add a card to the hand and update the running totals."""
+
+        self.cards.append(card)
+        self.hard_total += card.value
+        if card.id == 1:
+            self.has_ace = True
+
+    def split_card(self):
+        """Remove and return the second card of a pair."""
+
+        card = self.cards.pop()
+        self.hard_total -= card.value
+        self.has_ace = self.cards[0].id == 1
+        return card
+
+    def score(self):
+        """Return the point total, counting one Ace as 11 when that does
+        not bust the hand.
+        """
+
+        if self.has_ace and self.hard_total <= 11:
+            return self.hard_total + 10
+
+        return self.hard_total
+
+    def is_soft(self):
+        """Return True if the hand holds an Ace currently counted as 11."""
+
+        return self.has_ace and self.hard_total <= 11
+
+    def is_pair(self):
+        """Return True if the hand is two cards of the same point value."""
+
+        cards = self.cards
+        return len(cards) == 2 and cards[0].value == cards[1].value
+
+    def is_blackjack(self):
+        """Return True if the hand is a two card 21 that was not split."""
+
+        return (self.has_ace and self.hard_total == 11
+                and len(self.cards) == 2 and not self.split)
+
+    def is_bust(self):
+        """Return True if the hand is over 21."""
+
+        return self.hard_total > 21
+
+    def flags(self):
+        """Return how the hand was played packed into one byte."""
+
+        return (self.split | self.doubled << 1 | self.surrendered << 2 |
+                self.done << 3)
+
+    def set_flags(self, flags):
+        """Set how the hand was played from a byte made by flags()."""
+
+        self.split = bool(flags & 1)
+        self.doubled = bool(flags & 2)
+        self.surrendered = bool(flags & 4)
+        self.done = bool(flags & 8)
+
+
+class HandPool(object):
+    """Free list of Hand objects, so that the extra hands made by splits
+    are recycled between rounds instead of allocated for every split.
+    """
+
+    def __init__(self):
+        self.free = []
+        self.created = 0  # Hands ever allocated by this pool
+
+    def acquire(self):
+        """Return an empty hand."""
+
+        if self.free:
+            return self.free.pop()
+        self.created += 1
+        return Hand()
+
+    def release(self, hand):
+        """Empty a hand and keep it for a later acquire()."""
+
+        hand.reset()
+        self.free.append(hand)
+
 
 class BlackjackDealer(object):
-    """Contains attributes and operators for a Blackjack card dealer."""
+    """Contains attributes and operators for a Blackjack card dealer.
+
+    A player may hold several hands after splitting. self.hands lists them
+    in playing order and self.hand is the one in play; every hand method
+    works on self.hand.
+    """
+
+    __slots__ = ('name', 'hands', 'hand')
 
     def __init__(self):
         self.name = 'Dealer'
-        self.hand = list()
-        self.score = 0
+        self.hand = Hand()
+        self.hands = [self.hand]
 
     def __iter__(self):
-        return iter(self.hand)
+        return iter(self.hand.cards)
+
+    def __len__(self):
+        return len(self.hand.cards)
 
     def __str__(self):
         return self.name
 
     def __contains__(self, item):
-        return item in self.hand
+        return item in self.hand.cards
 
-    def reset(self):
-        """Empty the hand."""
-        
-        self.hand = list()
+    @property
+    def hard_total(self):
+        return self.hand.hard_total
+
+    @property
+    def has_ace(self):
+        return self.hand.has_ace
+
+    def reset(self, pool=None):
+        """Empty the first hand and drop any split hands, returning them
+        to pool when one is given.
+        """
+
+        hands = self.hands
+        if len(hands) > 1:
+            if pool is not None:
+                for hand in hands[1:]:
+                    pool.release(hand)
+            del hands[1:]
+        self.hand = hands[0]
+        self.hand.reset()
 
     def score(self):
-        """Return point value total of cards in the player's hand."""
+        """Return point value total of cards in the player's hand, counting
+        one Ace as 11 when that does not bust the hand.
+        """
+
+        hand = self.hand
+        if hand.has_ace and hand.hard_total <= 11:
+            return hand.hard_total + 10
 
-        return sum(self.hand)
+        return hand.hard_total
+
+    def is_soft(self):
+        """Return True if the hand holds an Ace currently counted as 11."""
+
+        return self.hand.is_soft()
+
+    def is_blackjack(self):
+        """Return True if the hand is a two card 21."""
+
+        return self.hand.is_blackjack()
+
+    def is_bust(self):
+        """Return True if the hand is over 21."""
+
+        return self.hand.hard_total > 21
 
     def take_card(self, card):
-        """Add a card to the hand."""
+        """Add a card to the hand and update the running totals."""
 
-        self.hand.append(card)
+        self.hand.take_card(card)
 
 
 class BlackjackPlayer(BlackjackDealer):
@@ -38,7 +214,10 @@ class BlackjackPlayer(BlackjackDealer):
     operators for manipulating money and keeping score.
     """
 
+    __slots__ = ('money', 'current_bet', 'highest_win', 'highest_loss')
+
     def __init__(self, name='Player'):
+        super(BlackjackPlayer, self).__init__()
         self.name = name
         self.money = 500  # Start game with $500
         self.current_bet = 0
@@ -0,0 +1,193 @@
+"""This module keeps player profiles, money and highest win and loss, in a
+local SQLite file so they outlive the process, and ranks them on a
+leaderboard. The database runs in WAL mode and settlements are held in
+memory and written in one transaction per flush interval, so a busy host
+commits a few times a second rather than once a hand. A crash loses at
+most the settlements of the last interval.
+
+Run ``python profiles.py FILE`` to print a leaderboard.
+"""
+__all__ = ['Profile', 'ProfileStore', 'LEADERBOARDS']
+
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT PRIMARY KEY,
+    money REAL NOT NULL,
+    highest_win REAL NOT NULL DEFAULT 0,
+    highest_loss REAL NOT NULL DEFAULT 0,
+    hands INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS profiles_highest_win
+    ON profiles (highest_win DESC);
+CREATE INDEX IF NOT EXISTS profiles_highest_loss
+    ON profiles (highest_loss DESC);
+'''
+
+# Money is whatever the player has now, the highs only ever go up and the
+# hand count adds up, so any number of settlements of one player collapse
+# into one row write.
+UPSERT = '''
+INSERT INTO profiles (name, money, highest_win, highest_loss, hands, updated)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    money = excluded.money,
+    highest_win = max(highest_win, excluded.highest_win),
+    highest_loss = max(highest_loss, excluded.highest_loss),
+    hands = hands + excluded.hands,
+    updated = excluded.updated
+'''
+
+LEADERBOARDS = ('highest_win', 'highest_loss')
+
+Profile = namedtuple('Profile', ['name', 'money', 'highest_win',
+                                 'highest_loss', 'hands'])
+
+
+class ProfileStore(object):
+    """Player profiles in a SQLite file.
+
+    settle() only notes a player's state. The notes are written together
+    when flush_interval seconds have passed since the last write, when
+    flush_records players are waiting, or when flush() or close() is
+    called. Use the store from one thread.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_records=10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.pending = {}  # Name to [money, highest win, highest loss, hands]
+        self.last_flush = time.monotonic()
+        self.writes = 0    # Settlements written
+        self.commits = 0   # Transactions committed
+
+        # Autocommit mode, the store opens its own transactions
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')  # Durable per checkpoint
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, name):
+        """Return the Profile of a name, or None if it has never played."""
+
+        pending = self.pending.get(name)
+        row = self.db.execute(
+            'SELECT name, money, highest_win, highest_loss, hands '
+            'FROM profiles WHERE name = ?', (name,)).fetchone()
+        if pending is None:
+            return None if row is None else Profile(*row)
+
+        money, highest_win, highest_loss, hands = pending
+        if row is not None:
+            highest_win = max(highest_win, row[2])
+            highest_loss = max(highest_loss, row[3])
+            hands += row[4]
+        return Profile(name, money, highest_win, highest_loss, hands)
+
+    def load(self, player):
+        """Give a BlackjackPlayer the money and highest win and loss saved
+        under its name. Return True if there was a profile, otherwise the
+        player keeps its starting money and False is returned.
+        """
+
+        profile = self.get(player.name)
+        if profile is None:
+            return False
+        player.money = profile.money
+        player.highest_win = profile.highest_win
+        player.highest_loss = profile.highest_loss
+        return True
+
+    def settle(self, player, hands=1):
+        """Note a BlackjackPlayer's state after hands settled hands, and
+        write every note if a flush is due.
+        """
+
+        pending = self.pending.get(player.name)
+        if pending is None:
+            self.pending[player.name] = [player.money, player.highest_win,
+                                         player.highest_loss, hands]
+        else:
+            pending[0] = player.money
+            pending[1] = max(pending[1], player.highest_win)
+            pending[2] = max(pending[2], player.highest_loss)
+            pending[3] += hands
+        self.writes += hands
+
+        if len(self.pending) >= self.flush_records or \
+                time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write every noted settlement in one transaction."""
+
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        now = time.time()
+        rows = [(name, money, highest_win, highest_loss, hands, now)
+                for name, (money, highest_win, highest_loss, hands)
+                in self.pending.items()]
+        self.db.execute('BEGIN')
+        try:
+            self.db.executemany(UPSERT, rows)
+        except sqlite3.Error:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        self.pending = {}
+        self.commits += 1
+
+    def leaderboard(self, by='highest_win', limit=10):
+        """Return the top limit Profiles by highest_win or highest_loss."""
+
+        if by not in LEADERBOARDS:
+            raise ValueError('no leaderboard for {0}'.format(by))
+        self.flush()
+        rows = self.db.execute(
+            'SELECT name, money, highest_win, highest_loss, hands '
+            'FROM profiles ORDER BY {0} DESC, name LIMIT ?'.format(by),
+            (limit,))
+        return [Profile(*row) for row in rows]
+
+    def close(self):
+        """Flush and close the database."""
+
+        self.flush()
+        self.db.close()
+
+
+def main(argv=None):
+    """Command line entry point for printing a leaderboard."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the leaderboard.')
+    parser.add_argument('db', help='profile database file')
+    parser.add_argument('--by', choices=LEADERBOARDS, default='highest_win')
+    parser.add_argument('-n', '--limit', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with ProfileStore(args.db) as store:
+        print('{0:<4} {1:<12} {2:>12} {3:>12} {4:>12} {5:>8}'.format(
+            'rank', 'name', 'money', 'highest win', 'highest loss', 'hands'))
+        for rank, profile in enumerate(store.leaderboard(args.by, args.limit),
+                                       1):
+            print('{0:<4} {1:<12} {2:>12,.2f} {3:>12,.2f} {4:>12,.2f} '
+                  '{5:>8,}'.format(rank, *profile))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,119 @@
+"""This module times the Blackjack engine's operations without a profiler.
+Instrumenting a game replaces its hot methods with timed wrappers on that
+instance only, so a game that is not instrumented runs the plain methods
+and pays nothing.
+"""
+__all__ = ['Profiler', 'GAME_OPERATIONS', 'DECK_OPERATIONS']
+
+import json
+import sys
+import time
+from collections import deque
+
+GAME_OPERATIONS = ('deal', 'hit', 'check_hand', '_shuffle_time')
+DECK_OPERATIONS = ('shuffle', 'draw')
+
+
+class Profiler(object):
+    """Call counts and latencies for instrumented operations.
+
+    The most recent samples latencies of each operation are kept for the
+    percentiles. If dump_every is given, a JSON snapshot is written to
+    stream at most that often, in seconds.
+    """
+
+    def __init__(self, samples=10000, dump_every=None, stream=None):
+        self.samples = samples
+        self.dump_every = dump_every
+        self.stream = sys.stderr if stream is None else stream
+        self.calls = {}
+        self.totals = {}
+        self.latencies = {}
+        self.started = time.perf_counter()
+        self.last_dump = self.started
+
+    def record(self, name, elapsed):
+        """Add one call of an operation that took elapsed seconds."""
+
+        if name not in self.calls:
+            self.calls[name] = 0
+            self.totals[name] = 0.0
+            self.latencies[name] = deque(maxlen=self.samples)
+        self.calls[name] += 1
+        self.totals[name] += elapsed
+        self.latencies[name].append(elapsed)
+
+        if self.dump_every is not None:
+            now = time.perf_counter()
+            if now - self.last_dump >= self.dump_every:
+                self.last_dump = now
+                self.dump()
+
+    def timed(self, name, func):
+        """Return func wrapped so that every call is recorded as name."""
+
+        clock = time.perf_counter
+        record = self.record
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, clock() - start)
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def instrument(self, game):
+        """Time the hot operations of a Blackjack game and its deck."""
+
+        for name in GAME_OPERATIONS:
+            setattr(game, name, self.timed('Blackjack.' + name,
+                                           getattr(game, name)))
+        for name in DECK_OPERATIONS:
+            setattr(game.deck, name, self.timed('CardDeck.' + name,
+                                                getattr(game.deck, name)))
+        return game
+
+    @staticmethod
+    def uninstrument(game):
+        """Put back the plain methods of an instrumented game."""
+
+        for name in GAME_OPERATIONS:
+            game.__dict__.pop(name, None)
+        for name in DECK_OPERATIONS:
+            game.deck.__dict__.pop(name, None)
+
+    def snapshot(self):
+        """Return the statistics so far as a dict."""
+
+        operations = {}
+        for name, calls in self.calls.items():
+            latencies = sorted(self.latencies[name])
+            last = len(latencies) - 1
+            operations[name] = {
+                'calls': calls,
+                'total': self.totals[name],
+                'mean': self.totals[name] / calls,
+                'p50': latencies[last // 2],
+                'p90': latencies[last * 9 // 10],
+                'p99': latencies[last * 99 // 100],
+                'max': latencies[-1],
+            }
+
+        rounds = self.calls.get('Blackjack.deal', 0)
+        shuffles = self.calls.get('CardDeck.shuffle', 0)
+        return {
+            'elapsed': time.perf_counter() - self.started,
+            'operations': operations,
+            'rounds': rounds,
+            'reshuffles': shuffles,
+            'rounds_per_reshuffle': rounds / shuffles if shuffles else None,
+        }
+
+    def dump(self):
+        """Write a snapshot to the stream as one line of JSON."""
+
+        self.stream.write(json.dumps(self.snapshot(), sort_keys=True) + '\n')
+        self.stream.flush()
@@ -0,0 +1,465 @@
+"""This module hosts many Blackjack tables from one process. Clients send
+one JSON object per line over a local TCP or Unix socket and get one JSON
+object per line back, in the order the commands were sent.
+
+Commands, with an optional "id" that is echoed back:
+
+    {"op": "join", "table": "t1", "name": "Charles"}
+    {"op": "bet", "table": "t1", "amount": 25}
+    {"op": "deal", "table": "t1"}
+    {"op": "hit", "table": "t1"}
+    {"op": "stand", "table": "t1"}
+    {"op": "double", "table": "t1"}
+    {"op": "split", "table": "t1"}
+    {"op": "surrender", "table": "t1"}
+    {"op": "leave", "table": "t1"}
+    {"op": "stats"}
+
+A player leaving, or whose connection closes, stands on any hand in play
+and frees the seat.
+
+Run ``python server.py serve`` to start a server and ``python server.py
+load`` to measure one with the load generator. With ``--db FILE`` players
+keep their money and highs between visits, see profiles.py.
+"""
+__all__ = ['Table', 'BlackjackServer', 'run_load']
+
+import asyncio
+import json
+import sys
+import time
+
+from cards import Blackjack
+from players import BlackjackPlayer, MINIMUM_BET, MAXIMUM_BET
+
+COMMANDS = ('join', 'bet', 'deal', 'hit', 'stand', 'double', 'split',
+            'surrender', 'leave')
+
+
+class TableError(Exception):
+    """A command that cannot be carried out at the table right now."""
+
+
+class Table(object):
+    """One Blackjack game with its own shoe and a single seat.
+
+    Every command runs to completion without awaiting, so commands for a
+    table are applied one at a time in the order the event loop receives
+    them and no lock is needed.
+    """
+
+    def __init__(self, table_id, decks=2, shuffle=25, profiles=None):
+        self.table_id = table_id
+        self.game = Blackjack(MINIMUM_BET, decks=decks, shuffle=shuffle)
+        self.profiles = profiles  # ProfileStore, or None to keep nothing
+        self.seated = None     # Name of the seated player
+        self.in_round = False  # A hand has been dealt and not settled
+        self.actions = 0       # Commands handled
+
+    def state(self, outcomes=None):
+        """Return the table as a dict for a response."""
+
+        player = self.game.player
+        dealer = self.game.dealer
+        state = {
+            'table': self.table_id,
+            'player': [str(card) for card in player],
+            'score': player.score(),
+            'hands': [[str(card) for card in hand] for hand in player.hands],
+            'hand': player.hands.index(player.hand),
+            'dealer': [str(card) if card.face() else 'face down'
+                       for card in dealer],
+            'money': player.money,
+            'bet': player.current_bet,
+            'in_round': self.in_round,
+        }
+        if outcomes is not None:  # One per hand, split hands included
+            state['outcome'] = outcomes[0]
+            state['outcomes'] = outcomes
+            state['dealer_score'] = dealer.score()
+        return state
+
+    def _finish(self):
+        self.in_round = False
+        outcomes = self.game.finish_round()
+        if self.profiles is not None:
+            self.profiles.settle(self.game.player, len(outcomes))
+        return self.state(outcomes)
+
+    def _next_hand(self):
+        """End the hand in play and move to the next split hand that needs
+        a decision, finishing the round when there is none.
+        """
+
+        game = self.game
+        player = game.player
+        while game.stay(player):
+            if not player.hand.done and game.check_hand(player) == 'okay':
+                return self.state()
+        return self._finish()
+
+    def _act(self, allowed, action, name):
+        if not self.in_round:
+            raise TableError('no hand in play')
+        player = self.game.player
+        if not allowed(player):
+            raise TableError('cannot {0} this hand'.format(name))
+        action(player)
+        if player.hand.done or self.game.check_hand(player) != 'okay':
+            return self._next_hand()
+        return self.state()
+
+    def join(self, name):
+        if self.seated not in (None, name):
+            raise TableError('table is taken')
+        if self.seated is None:
+            self.game.player.name = name
+            if self.profiles is not None:
+                self.profiles.load(self.game.player)
+        self.seated = name
+        return self.state()
+
+    def leave(self):
+        """Stand on any hand in play and free the seat for a new player."""
+
+        if self.seated is None:
+            raise TableError('nobody is seated')
+        state = self._finish() if self.in_round else self.state()
+        game = self.game
+        game.player = game.players[0] = BlackjackPlayer()
+        game.player.set_bet(MINIMUM_BET)
+        self.seated = None
+        return state
+
+    def bet(self, amount):
+        if self.in_round:
+            raise TableError('cannot change the bet during a hand')
+        try:
+            amount = int(amount)
+        except (OverflowError, ValueError, TypeError):
+            raise TableError('bet must be a whole number')
+        if not MINIMUM_BET <= amount <= MAXIMUM_BET:
+            raise TableError('bet must be between {0} and {1}'.format(
+                MINIMUM_BET, MAXIMUM_BET))
+        self.game.player.set_bet(amount)
+        return self.state()
+
+    def deal(self):
+        if self.in_round:
+            raise TableError('a hand is already in play')
+        self.game.deal()
+        self.in_round = True
+        if self.game.player.is_blackjack() or self.game.dealer.is_blackjack():
+            return self._finish()
+        return self.state()
+
+    def hit(self):
+        return self._act(self.game.can_hit, self.game.hit, 'hit')
+
+    def stand(self):
+        if not self.in_round:
+            raise TableError('no hand in play')
+        return self._next_hand()
+
+    def double(self):
+        return self._act(self.game.can_double, self.game.double, 'double')
+
+    def split(self):
+        return self._act(self.game.can_split, self.game.split, 'split')
+
+    def surrender(self):
+        return self._act(self.game.can_surrender, self.game.surrender_hand,
+                         'surrender')
+
+
+class BlackjackServer(object):
+    """Accepts client connections and routes their commands to tables,
+    creating a table the first time a player joins it.
+    """
+
+    def __init__(self, decks=2, shuffle=25, profiles=None):
+        self.decks = decks
+        self.shuffle = shuffle
+        self.profiles = profiles
+        self.tables = {}
+        self.seats = {}  # Player name to the table they sit at
+        self.actions = 0
+        self.connections = 0
+
+    def handle(self, request, joined):
+        """Carry out one decoded command from a connection and return the
+        response dict. joined maps each table the connection has joined to
+        the name it seated there, and is kept up to date.
+        """
+
+        op = request.get('op')
+        if op == 'stats':
+            return {
+                'tables': len(self.tables),
+                'actions': self.actions,
+                'connections': self.connections,
+                'cpu': time.process_time(),
+            }
+
+        if op not in COMMANDS:
+            raise TableError('unknown command')
+
+        table_id = request.get('table')
+        if op == 'join':
+            # One seat per name, so a profile is only ever played, and
+            # saved, from one table
+            name = str(request.get('name', 'Player'))
+            seat = self.seats.get(name)
+            if seat is not None and seat != table_id:
+                raise TableError('{0} is already seated at {1}'.format(
+                    name, seat))
+            if seat is not None and joined.get(table_id) != name:
+                raise TableError('{0} is seated by another connection'.format(
+                    name))
+            if table_id not in self.tables:
+                self.tables[table_id] = Table(table_id, self.decks,
+                                              self.shuffle, self.profiles)
+            table = self.tables[table_id]
+            response = table.join(name)
+            self.seats[name] = table_id
+            joined[table_id] = name
+        else:
+            table = self.tables.get(table_id)
+            if table is None:
+                raise TableError('unknown table')
+            if table_id not in joined:
+                raise TableError('not seated at this table')
+            if op == 'bet':
+                response = table.bet(request.get('amount', MINIMUM_BET))
+            elif op == 'deal':
+                response = table.deal()
+            elif op == 'hit':
+                response = table.hit()
+            elif op == 'stand':
+                response = table.stand()
+            elif op == 'double':
+                response = table.double()
+            elif op == 'split':
+                response = table.split()
+            elif op == 'surrender':
+                response = table.surrender()
+            else:
+                response = self.leave(table)
+                del joined[table_id]
+
+        table.actions += 1
+        self.actions += 1
+        return response
+
+    def leave(self, table):
+        """Free a table's seat and the name that sat there."""
+
+        self.seats.pop(table.seated, None)
+        return table.leave()
+
+    async def client_connected(self, reader, writer):
+        """Serve one connection until the client disconnects, then free
+        every seat it joined.
+        """
+
+        self.connections += 1
+        joined = {}  # Table to the name this connection seated there
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # Longer than the stream limit
+                    writer.write(json.dumps({
+                        'ok': False, 'error': 'command too long'}).encode() +
+                        b'\n')
+                    break
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = json.loads(line)
+                    response = self.handle(request, joined)
+                    response['ok'] = True
+                except (TableError, ValueError, TypeError, AttributeError,
+                        OverflowError, RecursionError) as error:
+                    response = {'ok': False, 'error': str(error)}
+                if isinstance(request, dict) and 'id' in request:
+                    response['id'] = request['id']
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            for table_id, name in joined.items():
+                table = self.tables[table_id]
+                if table.seated == name:  # Not since left and retaken
+                    self.leave(table)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        """Listen on a TCP port, or a Unix socket if path is given, until
+        cancelled.
+        """
+
+        if path:
+            server = await asyncio.start_unix_server(self.client_connected,
+                                                     path=path)
+        else:
+            server = await asyncio.start_server(self.client_connected,
+                                                host, port)
+        async with server:
+            if self.profiles is None:
+                await server.serve_forever()
+                return
+            flusher = asyncio.ensure_future(self._flush_profiles())
+            try:
+                await server.serve_forever()
+            finally:
+                flusher.cancel()
+                self.profiles.flush()
+
+    async def _flush_profiles(self):
+        """Write waiting settlements even while no table is settling."""
+
+        while True:
+            await asyncio.sleep(self.profiles.flush_interval)
+            self.profiles.flush()
+
+
+async def _open(host, port, path):
+    if path:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def _request(reader, writer, latencies, **command):
+    start = time.perf_counter()
+    writer.write(json.dumps(command).encode() + b'\n')
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    latencies.append(time.perf_counter() - start)
+    return response
+
+
+async def _load_client(client, tables, rounds, host, port, path, latencies):
+    """Drive a share of the tables over one connection, one action at a
+    time, hitting below 17.
+    """
+
+    reader, writer = await _open(host, port, path)
+    names = ['load-{0}-{1}'.format(client, index) for index in range(tables)]
+    for name in names:
+        await _request(reader, writer, latencies, op='join', table=name,
+                       name=name)
+        await _request(reader, writer, latencies, op='bet', table=name,
+                       amount=MINIMUM_BET)
+    for count in range(rounds):
+        for name in names:
+            state = await _request(reader, writer, latencies, op='deal',
+                                   table=name)
+            while state.get('in_round') and state['score'] < 17:
+                state = await _request(reader, writer, latencies, op='hit',
+                                       table=name)
+            if state.get('in_round'):
+                await _request(reader, writer, latencies, op='stand',
+                               table=name)
+    writer.close()
+
+
+async def run_load(tables=1000, rounds=10, connections=50, host='127.0.0.1',
+                   port=8765, path=None):
+    """Play rounds on every table through a running server and return a
+    dict of latency percentiles and throughput.
+    """
+
+    reader, writer = await _open(host, port, path)
+    latencies = []
+    before = await _request(reader, writer, [], op='stats')
+
+    # Spread the tables as evenly as they go, no connection without one
+    connections = max(1, min(connections, tables))
+    shares = [tables // connections + (client < tables % connections)
+              for client in range(connections)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _load_client(client, share, rounds, host, port, path, latencies)
+        for client, share in enumerate(shares) if share])
+    elapsed = time.perf_counter() - start
+
+    after = await _request(reader, writer, [], op='stats')
+    writer.close()
+
+    latencies.sort()
+    if latencies:
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    else:
+        p50 = p99 = float('nan')
+    cores = (after['cpu'] - before['cpu']) / elapsed
+    played = sum(shares)
+    return {
+        'tables': played,
+        'actions': len(latencies),
+        'actions_per_sec': len(latencies) / elapsed,
+        'p50_ms': p50,
+        'p99_ms': p99,
+        'server_cores': cores,
+        'tables_per_core': played / cores if cores else float('inf'),
+    }
+
+
+def main(argv=None):
+    """Command line entry point for the server and the load generator."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Blackjack table server.')
+    parser.add_argument('command', choices=('serve', 'load'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='use a Unix socket instead of TCP')
+    parser.add_argument('-d', '--decks', type=int, default=2)
+    parser.add_argument('--db', metavar='FILE',
+                        help='keep player profiles in this SQLite file')
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                        help='seconds between profile writes')
+    parser.add_argument('--tables', type=int, default=1000,
+                        help='tables for the load generator to play')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='rounds per table for the load generator')
+    parser.add_argument('--connections', type=int, default=50,
+                        help='load generator connections')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        profiles = None
+        if args.db:
+            from profiles import ProfileStore
+            profiles = ProfileStore(args.db, args.flush_interval)
+        server = BlackjackServer(decks=args.decks, profiles=profiles)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        finally:
+            if profiles is not None:
+                profiles.close()
+    else:
+        report = asyncio.run(run_load(args.tables, args.rounds,
+                                      args.connections, args.host,
+                                      args.port, args.unix))
+        print('Tables: {tables}  Actions: {actions}'.format(**report))
+        print('Actions/sec: {actions_per_sec:,.0f}'.format(**report))
+        print('Latency p50: {p50_ms:.3f} ms  p99: {p99_ms:.3f} ms'.format(
+            **report))
+        print('Server cores used: {server_cores:.2f}  Tables per core: '
+              '{tables_per_core:,.0f}'.format(**report))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        sys.exit()
@@ -0,0 +1,9 @@
+import sys
+from simulation import main
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()
+        sys.exit()
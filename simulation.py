@@ -0,0 +1,389 @@
+"""This module plays complete rounds of Blackjack without a window so that
+strategies can be evaluated over a large number of hands. Nothing here
+imports tkinter.
+"""
+__all__ = ['SimulationResult', 'TrueCountSpread', 'play_round', 'play_seats',
+           'simulate', 'mimic_dealer', 'never_bust', 'always_stay',
+           'basic_strategy', 'STRATEGIES']
+
+import os
+import random
+import struct
+import sys
+import time
+
+from cards import Blackjack
+from stats import RoundStats
+
+
+def mimic_dealer(player, upcard):
+    """Hit below 17, just like the dealer."""
+
+    if player.score() < 17:
+        return 'hit'
+    return 'stay'
+
+
+def never_bust(player, upcard):
+    """Only hit when the next card cannot bust the hand."""
+
+    if player.score() < 12:
+        return 'hit'
+    return 'stay'
+
+
+def always_stay(player, upcard):
+    """Never take another card."""
+
+    return 'stay'
+
+
+_basic = []
+
+
+def basic_strategy(player, upcard):
+    """Play basic strategy for the default table rules, splitting, doubling
+    and surrendering where it pays.
+    """
+
+    if not _basic:
+        from strategy import BasicStrategy
+        _basic.append(BasicStrategy.generate())
+    return _basic[0].play(player, upcard)
+
+
+STRATEGIES = {
+    'dealer': mimic_dealer,
+    'never-bust': never_bust,
+    'stay': always_stay,
+    'basic': basic_strategy,
+}
+
+
+# Checkpoint file header: magic, rounds played, then the result totals,
+# followed by the packed RoundStats
+CHECKPOINT = struct.Struct('<4sQQQQQQQQd')
+PRECISION_CHECK = 1000  # Rounds between checks of the EV interval
+
+
+class TrueCountSpread(object):
+    """Betting callback that raises the bet with the true count of the
+    shoe: one minimum bet at a true count of 1 or less, one more for each
+    point above that, never more than max_bet.
+    """
+
+    def __init__(self, min_bet=5, max_bet=50):
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+
+    def __call__(self, deck):
+        units = max(1, int(deck.true_count()))
+        return min(self.min_bet * units, self.max_bet)
+
+
+class SimulationResult(object):
+    """Aggregate totals for a number of simulated hands."""
+
+    def __init__(self):
+        self.hands = 0       # Rounds played
+        self.wins = 0        # Rounds won, not counting naturals
+        self.blackjacks = 0  # Rounds won with a natural
+        self.pushes = 0      # Rounds tied with the dealer
+        self.losses = 0      # Rounds lost, including busts
+        self.busts = 0       # Rounds where the player went over 21
+        self.reshuffles = 0  # Times the shoe was shuffled
+        self.net = 0         # Money won or lost over all rounds
+        self.elapsed = 0.0   # Wall clock seconds spent playing
+        self.stats = RoundStats()
+
+    def merge(self, other):
+        """Add the totals of another result into this one. Elapsed time is
+        left to the caller since merged runs may have overlapped.
+        """
+
+        self.hands += other.hands
+        self.wins += other.wins
+        self.blackjacks += other.blackjacks
+        self.pushes += other.pushes
+        self.losses += other.losses
+        self.busts += other.busts
+        self.reshuffles += other.reshuffles
+        self.net += other.net
+        self.stats.merge(other.stats)
+
+    def pack(self, played):
+        """Return the totals and the rounds played so far as bytes."""
+
+        return CHECKPOINT.pack(b'BJCP', played, self.hands, self.wins,
+                               self.blackjacks, self.pushes, self.losses,
+                               self.busts, self.reshuffles,
+                               self.net) + self.stats.pack()
+
+    def unpack(self, data):
+        """Load totals saved by pack() and return the rounds played and
+        the offset past them.
+        """
+
+        (magic, played, self.hands, self.wins, self.blackjacks, self.pushes,
+         self.losses, self.busts, self.reshuffles, self.net) = \
+            CHECKPOINT.unpack_from(data)
+        if magic != b'BJCP':
+            raise ValueError('not a simulation checkpoint')
+        return played, self.stats.unpack(data, CHECKPOINT.size)
+
+    def precise(self, precision):
+        """Return True once the 95% interval of the EV per round, in bets,
+        is no wider than precision either side.
+        """
+
+        return self.stats.net.half_width() <= precision
+
+    def record(self, outcome, net, bust=False):
+        """Add the outcome of a single round to the totals."""
+
+        self.hands += 1
+        self.net += net
+        if outcome == 'win':
+            self.wins += 1
+        elif outcome == 'blackjack':
+            self.blackjacks += 1
+        elif outcome == 'push':
+            self.pushes += 1
+        else:
+            self.losses += 1
+        if bust:
+            self.busts += 1
+
+    def hands_per_sec(self):
+        """Return the number of rounds played per second."""
+
+        if not self.elapsed:
+            return 0.0
+        return self.hands / self.elapsed
+
+    def net_per_hand(self):
+        """Return the average money won or lost per round."""
+
+        if not self.hands:
+            return 0.0
+        return self.net / self.hands
+
+    def summary(self):
+        """Return a printable report of the totals."""
+
+        lines = [
+            'Hands played: {0}'.format(self.hands),
+            'Wins: {0}  Blackjacks: {1}  Pushes: {2}  Losses: {3}'.format(
+                self.wins, self.blackjacks, self.pushes, self.losses),
+            'Busts: {0}  Reshuffles: {1}'.format(self.busts, self.reshuffles),
+            'Net: {0:+.2f}  Per hand: {1:+.4f}'.format(self.net,
+                                                      self.net_per_hand()),
+            'Hands/sec: {0:,.0f}'.format(self.hands_per_sec()),
+        ]
+        if self.stats.net.count:
+            lines.append(self.stats.summary())
+        return '\n'.join(lines)
+
+
+def play_seats(game, strategy):
+    """Deal and play one complete round at every seat, returning the
+    settled outcome of every hand in seat order.
+
+    strategy is called as strategy(player, upcard) for the hand in play,
+    player.hand, and returns 'hit' to take another card, 'double', 'split'
+    or 'surrender' where the table allows it, or anything else to stay.
+    """
+
+    game.deal()
+
+    if not game.dealer.is_blackjack():
+        upcard = game.dealer_upcard()
+        for player in game.players:
+            if player.is_blackjack():
+                continue
+            while True:  # Once for each hand the player ends up with
+                hand = player.hand
+                while not hand.done and game.check_hand(player) == 'okay':
+                    action = strategy(player, upcard)
+                    if action == 'hit' and game.can_hit(player):
+                        game.hit(player)
+                    elif action == 'double' and game.can_double(player):
+                        game.double(player)
+                    elif action == 'split' and game.can_split(player):
+                        game.split(player)
+                    elif (action == 'surrender' and
+                          game.can_surrender(player)):
+                        game.surrender_hand(player)
+                    else:
+                        break
+                if not game.stay(player):
+                    break
+
+    return game.finish_round()
+
+
+def play_round(game, strategy):
+    """Deal and play one complete round, returning the outcome of the
+    first seat's first hand. See play_seats.
+    """
+
+    return play_seats(game, strategy)[0]
+
+
+def _save_checkpoint(path, game, result, played):
+    """Write a checkpoint next to path and move it into place, so a crash
+    mid write leaves the previous checkpoint intact.
+    """
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as checkpoint_file:
+        checkpoint_file.write(result.pack(played) + game.snapshot())
+    os.replace(temp_path, path)
+
+
+def simulate(strategy, hands, bet=5, decks=2, shuffle=25, rng=None,
+             betting=None, history=None, checkpoint=None,
+             checkpoint_every=10000, profiler=None, continuous=False,
+             seats=1, precision=None):
+    """Play the given number of rounds with the strategy and return a
+    SimulationResult. rng and continuous are handed to the shoe, see
+    CardDeck.
+
+    betting, if given, is called as betting(deck) before every round and
+    returns the bet to place, otherwise every round bets bet. history, a
+    HandHistoryWriter, logs every round when given.
+
+    checkpoint is a file path. The game and totals are saved there every
+    checkpoint_every rounds, and if the file already exists the run picks
+    up from it instead of starting over. Rounds logged to history after
+    the last checkpoint are logged again on resume.
+
+    profiler, a profiling.Profiler, times the game's operations when given.
+
+    seats players share the shoe and every seat plays the strategy. Each
+    seat's hand, and each hand split from it, counts as one hand in the
+    result.
+
+    precision, in bets, stops the run early, before hands rounds, once the
+    95% interval of the EV per round is that narrow. It is checked every
+    PRECISION_CHECK rounds.
+    """
+
+    game = Blackjack(bet, decks=decks, shuffle=shuffle, rng=rng,
+                     continuous=continuous, seats=seats)
+    if profiler is not None:
+        profiler.instrument(game)
+    players = game.players
+    result = SimulationResult()
+    played = 0
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint, 'rb') as checkpoint_file:
+            data = checkpoint_file.read()
+        played, offset = result.unpack(data)
+        game.restore(data[offset:])
+
+    start = time.perf_counter()
+    for hand in range(played, hands):
+        if game.prepare_shoe():  # Shuffle before any bet reads the count
+            result.reshuffles += 1
+
+        if betting is not None:
+            bet = betting(game.deck)
+            for player in players:
+                player.set_bet(bet)
+
+        play_seats(game, strategy)
+        for player in players:
+            for seat_hand in player.hands:
+                result.record(seat_hand.outcome, seat_hand.net,
+                              seat_hand.is_bust())
+                if history is not None:
+                    history.record(game, seat_hand.outcome, seat_hand.net,
+                                   player, seat_hand)
+        result.stats.add_round(game)
+
+        if checkpoint is not None and (hand + 1) % checkpoint_every == 0:
+            if history is not None:
+                history.flush()
+            _save_checkpoint(checkpoint, game, result, hand + 1)
+
+        if precision is not None and (hand + 1) % PRECISION_CHECK == 0 \
+                and result.precise(precision):
+            break
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+def main(argv=None):
+    """Command line entry point for running a simulation."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Simulate hands of Blackjack without the game window.')
+    parser.add_argument('-n', '--hands', type=int, default=100000,
+                        help='number of rounds to play, the most with '
+                             '--precision')
+    parser.add_argument('-s', '--strategy', choices=sorted(STRATEGIES),
+                        default='dealer', help='player strategy')
+    parser.add_argument('-b', '--bet', type=int, default=5,
+                        help='bet placed on every round')
+    parser.add_argument('-d', '--decks', type=int, default=2,
+                        help='number of decks in the shoe')
+    parser.add_argument('--shuffle', type=int, default=25,
+                        help='percent of the shoe left when it is shuffled')
+    parser.add_argument('--csm', action='store_true',
+                        help='deal from a continuous shuffling machine')
+    parser.add_argument('--seats', type=int, default=1,
+                        help='players sharing the shoe, 1 to 7')
+    parser.add_argument('--spread', type=int, default=None, metavar='MAX',
+                        help='raise the bet with the Hi-Lo true count, up '
+                             'to MAX')
+    parser.add_argument('--precision', type=float, default=None,
+                        help='stop once the 95%% interval of the EV per '
+                             'round is this many bets either side')
+    parser.add_argument('--profile', action='store_true',
+                        help='time engine operations, in one process')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for a reproducible run')
+    args = parser.parse_args(argv)
+
+    from parallel import run_parallel, print_progress
+
+    if args.profile and args.workers > 1:
+        parser.error('--profile runs in one process, drop --workers')
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 32)
+
+    betting = None
+    if args.spread:
+        betting = TrueCountSpread(args.bet, args.spread)
+
+    if args.profile:
+        import json
+        from parallel import chunk_rng
+        from profiling import Profiler
+
+        profiler = Profiler()
+        result = simulate(STRATEGIES[args.strategy], args.hands, bet=args.bet,
+                          decks=args.decks, shuffle=args.shuffle,
+                          rng=chunk_rng(args.seed, 0), betting=betting,
+                          profiler=profiler, continuous=args.csm,
+                          seats=args.seats, precision=args.precision)
+        print(result.summary())
+        print(json.dumps(profiler.snapshot(), indent=2, sort_keys=True))
+        return
+    progress = print_progress if sys.stderr.isatty() else None
+
+    result = run_parallel(STRATEGIES[args.strategy], args.hands,
+                          seed=args.seed, workers=args.workers,
+                          bet=args.bet, decks=args.decks,
+                          shuffle=args.shuffle, betting=betting,
+                          progress=progress, continuous=args.csm,
+                          seats=args.seats, precision=args.precision)
+    print('Seed: {0}'.format(args.seed))
+    print(result.summary())
@@ -0,0 +1,245 @@
+"""This module keeps streaming statistics of simulated rounds in constant
+memory: running means and variances updated one value at a time with
+Welford's method, fixed bin histograms, and dealer outcome counts per
+upcard. Aggregates from separate runs merge into the statistics of the
+combined run, and every aggregate packs into a fixed number of bytes for
+checkpoints.
+"""
+__all__ = ['RunningStats', 'Histogram', 'DealerOutcomes', 'RoundStats',
+           'Z_95']
+
+import math
+import struct
+from array import array
+
+Z_95 = 1.959964  # Two sided 95% normal quantile
+
+RUNNING_STATS = struct.Struct('<Qdddd')  # count, mean, M2, minimum, maximum
+
+
+class RunningStats(object):
+    """Count, mean, variance and extremes of a stream of numbers."""
+
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value):
+        """Add one value, Welford's update."""
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """Combine with the statistics of another stream, Chan's parallel
+        update, as though every value had been added here.
+        """
+
+        if not other.count:
+            return
+        if not self.count:
+            (self.count, self.mean, self.m2, self.minimum,
+             self.maximum) = (other.count, other.mean, other.m2,
+                              other.minimum, other.maximum)
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def variance(self):
+        """Return the sample variance."""
+
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def half_width(self, z=Z_95):
+        """Return the half width of the confidence interval of the mean,
+        95% by default, or infinity before there are two values.
+        """
+
+        if self.count < 2:
+            return math.inf
+        return z * math.sqrt(self.variance() / self.count)
+
+    def pack(self):
+        return RUNNING_STATS.pack(self.count, self.mean, self.m2,
+                                  self.minimum, self.maximum)
+
+    def unpack(self, data, offset=0):
+        """Load values saved by pack() and return the offset past them."""
+
+        (self.count, self.mean, self.m2, self.minimum,
+         self.maximum) = RUNNING_STATS.unpack_from(data, offset)
+        return offset + RUNNING_STATS.size
+
+
+class Histogram(object):
+    """Counts of values in equal width bins from low to high, with values
+    outside the range counted in the first and last bins.
+    """
+
+    def __init__(self, low, high, width):
+        self.low = low
+        self.width = width
+        self.counts = array('Q', bytes(8 * (int((high - low) / width) + 1)))
+
+    def add(self, value):
+        index = int((value - self.low) / self.width)
+        self.counts[min(max(index, 0), len(self.counts) - 1)] += 1
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            counts[index] += count
+
+    def bins(self):
+        """Yield (lowest value, count) for every bin that is not empty."""
+
+        for index, count in enumerate(self.counts):
+            if count:
+                yield self.low + index * self.width, count
+
+    def size(self):
+        return self.counts.itemsize * len(self.counts)
+
+    def pack(self):
+        return self.counts.tobytes()
+
+    def unpack(self, data, offset=0):
+        end = offset + self.size()
+        self.counts = array('Q', bytes(data[offset:end]))
+        return end
+
+
+# Dealer results counted per upcard: a final 17 to 21, a natural or a bust
+DEALER_OUTCOMES = ('17', '18', '19', '20', '21', 'blackjack', 'bust')
+
+
+class DealerOutcomes(object):
+    """How often the dealer finishes on each total, for every upcard."""
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * 11 * len(DEALER_OUTCOMES)))
+
+    def add(self, upcard, dealer):
+        """Count a finished dealer hand under the upcard's point value."""
+
+        if dealer.is_blackjack():
+            column = 5
+        elif dealer.is_bust():
+            column = 6
+        else:
+            column = dealer.score() - 17
+        self.counts[upcard * len(DEALER_OUTCOMES) + column] += 1
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            counts[index] += count
+
+    def rates(self, upcard):
+        """Return the share of each DEALER_OUTCOMES for an upcard value."""
+
+        width = len(DEALER_OUTCOMES)
+        row = self.counts[upcard * width:(upcard + 1) * width]
+        total = sum(row)
+        return [count / total if total else 0.0 for count in row]
+
+    def size(self):
+        return self.counts.itemsize * len(self.counts)
+
+    def pack(self):
+        return self.counts.tobytes()
+
+    def unpack(self, data, offset=0):
+        end = offset + self.size()
+        self.counts = array('Q', bytes(data[offset:end]))
+        return end
+
+
+class RoundStats(object):
+    """Streaming statistics of a simulation: each seat's result per round
+    in bets, with its extremes standing in for BlackjackPlayer's highest
+    win and loss, a histogram of those results, the bust rate per hand and
+    the dealer's outcomes per upcard.
+    """
+
+    def __init__(self):
+        self.net = RunningStats()          # Bets won per seat per round
+        self.busts = RunningStats()        # 1 for a busted hand, else 0
+        self.histogram = Histogram(-8, 8, 0.5)
+        self.dealer = DealerOutcomes()
+
+    def add_round(self, game):
+        """Add a settled round of a Blackjack game."""
+
+        for player in game.players:
+            net = 0
+            for hand in player.hands:
+                net += hand.net
+                self.busts.add(1.0 if hand.is_bust() else 0.0)
+            if player.current_bet:
+                net /= player.current_bet
+            self.net.add(net)
+            self.histogram.add(net)
+        dealer = game.dealer
+        if game.dealer_played or dealer.is_blackjack():
+            self.dealer.add(game.dealer_upcard().value, dealer)
+
+    def merge(self, other):
+        self.net.merge(other.net)
+        self.busts.merge(other.busts)
+        self.histogram.merge(other.histogram)
+        self.dealer.merge(other.dealer)
+
+    def pack(self):
+        return b''.join((self.net.pack(), self.busts.pack(),
+                         self.histogram.pack(), self.dealer.pack()))
+
+    def unpack(self, data, offset=0):
+        """Load statistics saved by pack() and return the offset past
+        them.
+        """
+
+        offset = self.net.unpack(data, offset)
+        offset = self.busts.unpack(data, offset)
+        offset = self.histogram.unpack(data, offset)
+        return self.dealer.unpack(data, offset)
+
+    def summary(self):
+        """Return the statistics formatted for printing."""
+
+        net = self.net
+        lines = [
+            'EV per round: {0:+.4f} bets +/- {1:.4f} (95%)  SD: {2:.3f}'
+            .format(net.mean, net.half_width(), net.stddev()),
+            'Bust rate: {0:.2%}  Best round: {1:+g}  Worst round: {2:+g} '
+            'bets'.format(self.busts.mean, net.maximum, net.minimum),
+            'Dealer by upcard  ' + ' '.join('{0:>9}'.format(outcome)
+                                            for outcome in DEALER_OUTCOMES),
+        ]
+        for upcard in list(range(2, 11)) + [1]:
+            lines.append('{0:>16}  '.format('A' if upcard == 1 else upcard) +
+                         ' '.join('{0:>9.1%}'.format(rate)
+                                  for rate in self.dealer.rates(upcard)))
+        return '\n'.join(lines)
@@ -0,0 +1,384 @@
+"""This module generates infinite deck basic strategy for a set of table
+rules and stores it as compact lookup tables. Generating a table is slow
+enough that it should be done once and saved, after which every decision
+is a single index into a bytes object.
+"""
+__all__ = ['BasicStrategy', 'ACTIONS']
+
+import os
+import struct
+from functools import lru_cache
+
+# Point value probabilities for an infinite deck, indexed by value [1-10]
+CARD_PROBABILITY = (0.0,) + (1 / 13,) * 9 + (4 / 13,)
+
+# Table entries are single ASCII letters. Upper case D and R fall back to a
+# hit when doubling or surrendering is not allowed, lower case to a stay.
+ACTIONS = {
+    ord('H'): 'hit',
+    ord('S'): 'stay',
+    ord('D'): 'double',
+    ord('d'): 'double',
+    ord('P'): 'split',
+    ord('R'): 'surrender',
+    ord('r'): 'surrender',
+}
+FALLBACKS = {
+    ord('H'): 'hit',
+    ord('S'): 'stay',
+    ord('D'): 'hit',
+    ord('d'): 'stay',
+    ord('R'): 'hit',
+    ord('r'): 'stay',
+}
+
+FILE_MAGIC = b'BJBS'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<4sBBBBB')  # magic, version, decks, rule flags
+
+TOTALS = 22   # Rows in the hard and soft tables, indexed by total
+UPCARDS = 11  # Columns in every table, indexed by upcard value [1-10]
+
+
+def _score(hard, ace):
+    if ace and hard <= 11:
+        return hard + 10
+    return hard
+
+
+@lru_cache(maxsize=None)
+def _dealer_final(hard, ace, hit_soft_17):
+    """Return the probabilities of the dealer finishing on 17, 18, 19, 20,
+    21 or busting from the given hand.
+    """
+
+    if hard > 21:
+        return (0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+
+    total = _score(hard, ace)
+    soft = ace and hard <= 11
+    if total >= 17 and not (hit_soft_17 and soft and total == 17):
+        final = [0.0] * 6
+        final[total - 17] = 1.0
+        return tuple(final)
+
+    final = [0.0] * 6
+    for value in range(1, 11):
+        outcome = _dealer_final(hard + value, ace or value == 1, hit_soft_17)
+        for index in range(6):
+            final[index] += CARD_PROBABILITY[value] * outcome[index]
+
+    return tuple(final)
+
+
+@lru_cache(maxsize=None)
+def _dealer_distribution(upcard, hit_soft_17):
+    """Return the dealer's final total probabilities for an upcard, given
+    that the dealer has already checked for a natural and does not have one.
+    """
+
+    weights = list(CARD_PROBABILITY)
+    if upcard == 1:
+        weights[10] = 0.0
+    elif upcard == 10:
+        weights[1] = 0.0
+    scale = sum(weights)
+
+    final = [0.0] * 6
+    for value in range(1, 11):
+        if not weights[value]:
+            continue
+        outcome = _dealer_final(upcard + value, upcard == 1 or value == 1,
+                                hit_soft_17)
+        for index in range(6):
+            final[index] += weights[value] / scale * outcome[index]
+
+    return tuple(final)
+
+
+class _Evaluator(object):
+    """Expected values of each player action against one dealer upcard."""
+
+    def __init__(self, upcard, hit_soft_17, double_after_split, surrender):
+        self.upcard = upcard
+        self.dealer = _dealer_distribution(upcard, hit_soft_17)
+        self.double_after_split = double_after_split
+        self.surrender = surrender
+        self.stand_cache = {}
+        self.best_cache = {}
+
+    def stand(self, total):
+        if total > 21:
+            return -1.0
+        if total not in self.stand_cache:
+            win = self.dealer[5]
+            lose = 0.0
+            for index in range(5):
+                if 17 + index < total:
+                    win += self.dealer[index]
+                elif 17 + index > total:
+                    lose += self.dealer[index]
+            self.stand_cache[total] = win - lose
+        return self.stand_cache[total]
+
+    def hit(self, hard, ace):
+        ev = 0.0
+        for value in range(1, 11):
+            ev += CARD_PROBABILITY[value] * self.best(hard + value,
+                                                      ace or value == 1)
+        return ev
+
+    def best(self, hard, ace):
+        """EV of the better of hitting and standing, -1 once bust."""
+
+        if hard > 21:
+            return -1.0
+        key = (hard, ace)
+        if key not in self.best_cache:
+            self.best_cache[key] = max(self.stand(_score(hard, ace)),
+                                       self.hit(hard, ace))
+        return self.best_cache[key]
+
+    def double(self, hard, ace):
+        ev = 0.0
+        for value in range(1, 11):
+            ev += CARD_PROBABILITY[value] * self.stand(
+                _score(hard + value, ace or value == 1) if
+                hard + value <= 21 else 22)
+        return 2 * ev
+
+    def split(self, value):
+        """EV of splitting a pair, playing each hand once with no resplits.
+        Split Aces receive one card each.
+        """
+
+        ev = 0.0
+        for card in range(1, 11):
+            hard = value + card
+            ace = value == 1 or card == 1
+            if value == 1:
+                outcome = self.stand(_score(hard, ace))
+            else:
+                outcome = self.best(hard, ace)
+                if self.double_after_split:
+                    outcome = max(outcome, self.double(hard, ace))
+            ev += CARD_PROBABILITY[card] * outcome
+        return 2 * ev
+
+    def decide(self, hard, ace, pair=0):
+        """Return the table letter for a two card hand."""
+
+        stand = self.stand(_score(hard, ace))
+        hit = self.hit(hard, ace)
+        choices = [(stand, 'S'), (hit, 'H')]
+        choices.append((self.double(hard, ace), 'D' if hit >= stand else 'd'))
+        if self.surrender:
+            choices.append((-0.5, 'R' if hit >= stand else 'r'))
+        if pair:
+            choices.append((self.split(pair), 'P'))
+
+        return ord(max(choices)[1])
+
+
+class BasicStrategy(object):
+    """Basic strategy lookup tables for one set of table rules.
+
+    hard and soft are indexed by total * 11 + upcard value, pairs by the
+    value of the paired card * 11 + upcard value.
+    """
+
+    max_hands = 4          # Split limits of the table, see Blackjack
+    resplit_aces = False
+
+    def __init__(self, hard, soft, pairs, decks=2, hit_soft_17=False,
+                 double_after_split=True, surrender=False):
+        self.hard = bytes(hard)
+        self.soft = bytes(soft)
+        self.pairs = bytes(pairs)
+        self.deck_count = decks
+        self.hit_soft_17 = hit_soft_17
+        self.double_after_split = double_after_split
+        self.surrender = surrender
+
+    def __call__(self, player, upcard):
+        """Strategy callback for simulation.play_round, which can only hit
+        or stay.
+        """
+
+        if player.is_soft():
+            code = self.soft[player.score() * UPCARDS + upcard.value]
+        else:
+            code = self.hard[player.score() * UPCARDS + upcard.value]
+        return FALLBACKS[code]
+
+    def play(self, player, upcard):
+        """Strategy callback for simulation.play_seats that doubles, splits
+        and surrenders wherever the hand in play is allowed to.
+        """
+
+        hand = player.hand
+        upcard = upcard.value
+        first = len(hand) == 2 and not hand.done
+        if (first and hand.is_pair() and len(player.hands) < self.max_hands
+                and not (hand.split and hand.cards[0].id == 1 and
+                         not self.resplit_aces)):
+            code = self.pairs[hand.cards[0].value * UPCARDS + upcard]
+            if code == ord('P'):
+                return 'split'
+        elif hand.is_soft():
+            code = self.soft[hand.score() * UPCARDS + upcard]
+        else:
+            code = self.hard[hand.score() * UPCARDS + upcard]
+
+        if first:
+            if code in (ord('D'), ord('d')):
+                if self.double_after_split or not hand.split:
+                    return 'double'
+            elif code in (ord('R'), ord('r')):
+                if self.surrender and len(player.hands) == 1:
+                    return 'surrender'
+            else:
+                return ACTIONS[code]
+        return FALLBACKS[code]
+
+    @classmethod
+    def generate(cls, decks=2, hit_soft_17=False, double_after_split=True,
+                 surrender=False):
+        """Compute the optimal infinite deck strategy for the rules. The
+        deck count is recorded with the table but does not change it.
+        """
+
+        hard = bytearray(TOTALS * UPCARDS)
+        soft = bytearray(TOTALS * UPCARDS)
+        pairs = bytearray(UPCARDS * UPCARDS)
+
+        for upcard in range(1, 11):
+            evaluator = _Evaluator(upcard, hit_soft_17, double_after_split,
+                                   surrender)
+            for total in range(4, 22):
+                hard[total * UPCARDS + upcard] = evaluator.decide(total, False)
+            for total in range(12, 22):
+                soft[total * UPCARDS + upcard] = evaluator.decide(total - 10,
+                                                                  True)
+            for value in range(1, 11):
+                pairs[value * UPCARDS + upcard] = evaluator.decide(
+                    value * 2, value == 1, pair=value)
+
+        return cls(hard, soft, pairs, decks, hit_soft_17,
+                   double_after_split, surrender)
+
+    @classmethod
+    def for_game(cls, game):
+        """Generate the strategy for the rules of a Blackjack instance."""
+
+        strategy = cls.generate(game.deck_count, game.hit_soft_17,
+                                game.double_after_split, game.surrender)
+        strategy.max_hands = game.max_hands
+        strategy.resplit_aces = game.resplit_aces
+        return strategy
+
+    @classmethod
+    def load(cls, path):
+        """Read a strategy file, reusing the tables if it was already
+        loaded by this process.
+        """
+
+        path = os.path.abspath(path)
+        if path not in _loaded:
+            with open(path, 'rb') as strategy_file:
+                data = strategy_file.read()
+            magic, version, decks, h17, das, surrender = \
+                FILE_HEADER.unpack_from(data)
+            if magic != FILE_MAGIC or version != FILE_VERSION:
+                raise ValueError('{0} is not a strategy file'.format(path))
+            start = FILE_HEADER.size
+            hard = data[start:start + TOTALS * UPCARDS]
+            start += TOTALS * UPCARDS
+            soft = data[start:start + TOTALS * UPCARDS]
+            start += TOTALS * UPCARDS
+            pairs = data[start:start + UPCARDS * UPCARDS]
+            _loaded[path] = cls(hard, soft, pairs, decks, bool(h17),
+                                bool(das), bool(surrender))
+
+        return _loaded[path]
+
+    def save(self, path):
+        """Write the tables and rules to a strategy file."""
+
+        header = FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, self.deck_count,
+                                  self.hit_soft_17, self.double_after_split,
+                                  self.surrender)
+        with open(path, 'wb') as strategy_file:
+            strategy_file.write(header + self.hard + self.soft + self.pairs)
+
+    def action(self, total, soft, pair, upcard, first=True):
+        """Return the best action, one of 'hit', 'stay', 'double', 'split'
+        or 'surrender'. pair is the value of a paired card or 0, and first
+        is False once the hand has more than two cards.
+        """
+
+        if first and pair:
+            code = self.pairs[pair * UPCARDS + upcard]
+            if code == ord('P'):
+                return 'split'
+        elif soft:
+            code = self.soft[total * UPCARDS + upcard]
+        else:
+            code = self.hard[total * UPCARDS + upcard]
+
+        if first:
+            return ACTIONS[code]
+        return FALLBACKS[code]
+
+    def chart(self):
+        """Return the tables as printable text."""
+
+        header = '      ' + ' '.join('{0:>2}'.format('A' if up == 1 else up)
+                                    for up in range(2, 11))
+        header += '  A'
+        order = list(range(2, 11)) + [1]
+
+        def row(label, table, index):
+            return '{0:>5} '.format(label) + ' '.join(
+                ' ' + chr(table[index * UPCARDS + up]) for up in order)
+
+        lines = ['Hard', header]
+        lines += [row(total, self.hard, total) for total in range(5, 22)]
+        lines += ['Soft', header]
+        lines += [row('A,{0}'.format(total - 11), self.soft, total)
+                  for total in range(13, 22)]
+        lines += ['Pairs', header]
+        lines += [row('{0},{0}'.format('A' if value == 1 else value),
+                      self.pairs, value) for value in range(1, 11)]
+        return '\n'.join(lines)
+
+
+_loaded = {}  # Strategies read from disk, keyed by absolute path
+
+
+def main(argv=None):
+    """Command line entry point for generating a strategy file."""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Generate a basic strategy file for a set of rules.')
+    parser.add_argument('output', help='strategy file to write')
+    parser.add_argument('-d', '--decks', type=int, default=2,
+                        help='number of decks in the shoe')
+    parser.add_argument('--h17', action='store_true',
+                        help='dealer hits soft 17')
+    parser.add_argument('--no-das', action='store_true',
+                        help='no doubling after a split')
+    parser.add_argument('--surrender', action='store_true',
+                        help='late surrender is offered')
+    args = parser.parse_args(argv)
+
+    strategy = BasicStrategy.generate(args.decks, args.h17, not args.no_das,
+                                      args.surrender)
+    strategy.save(args.output)
+    print(strategy.chart())
+
+
+if __name__ == '__main__':
+    main()
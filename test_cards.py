@@ -0,0 +1,209 @@
+"""Tests for the shoe and the Blackjack table in cards.py."""
+import random
+from array import array
+
+import pytest
+
+from batch import strategy_table, verify
+from cards import Blackjack, CardDeck, MAX_SEATS
+from exact import ExactCalculator, pack_counts
+from simulation import basic_strategy, mimic_dealer, play_seats
+
+
+@pytest.mark.parametrize('shuffle', [0, 5, 25])
+def test_full_table_on_one_deck(shuffle):
+    game = Blackjack(5, decks=1, shuffle=shuffle, seats=MAX_SEATS,
+                     rng=random.Random(shuffle))
+    for round_ in range(2000):
+        play_seats(game, basic_strategy)
+        for player in game.players:
+            assert all(hand.outcome for hand in player.hands)
+
+
+def test_reshuffle_keeps_cards_in_play():
+    deck = CardDeck(decks=1, rng=random.Random(1), percent_left=0)
+    for card in range(40):
+        deck.draw_code()
+    deck.start_round()
+    in_play = [deck.draw_code() for card in range(12)]
+    drawn = in_play + [deck.draw_code() for card in range(40)]
+
+    assert deck.shuffles == 2
+    assert sorted(drawn) == sorted(list(range(52)))
+    assert sorted(deck.deck) == sorted(list(range(52)))
+    assert deck.remaining(1) == 4 - sum(1 for code in drawn if code % 13 == 0)
+
+
+def test_whole_shoe_in_play_raises():
+    deck = CardDeck(decks=1, rng=random.Random(1))
+    deck.start_round()
+    for card in range(52):
+        deck.draw_code()
+    with pytest.raises(IndexError):
+        deck.draw_code()
+
+
+def card(id_no, suit=0):
+    """Return the code of a card by id, [1-13], and suit index."""
+
+    return suit * 13 + id_no - 1
+
+
+def stacked(ids, bet=10, **rules):
+    """Return a one seat table whose shoe deals the card ids given first,
+    in casino order: player, upcard, player, hole card, then any draws.
+    """
+
+    game = Blackjack(bet, decks=2, rng=random.Random(0), **rules)
+    order = [card(id_no, index % 4) for index, id_no in enumerate(ids)]
+    rest = list(array('b', range(52)) * 2)
+    for code in order:
+        rest.remove(code)
+    game.deck.deck[:] = array('b', order + rest)
+    game.deck.position = 0
+    return game
+
+
+def test_double():
+    game = stacked([5, 10, 6, 7, 10])
+    game.deal()
+    player = game.player
+    assert game.can_double(player)
+    game.double(player)
+
+    assert player.hand.done and player.hand.doubled
+    assert len(player.hand.cards) == 3
+    assert game.finish_round() == ['win']
+    assert player.hand.net == 20
+    assert player.money == 520
+
+
+def test_split():
+    game = stacked([8, 6, 8, 10, 3, 10, 10])
+    game.deal()
+    player = game.player
+    assert game.can_split(player)
+    game.split(player)
+
+    first, second = player.hands
+    assert first.split and second.split
+    assert first.bet == second.bet == 10
+    assert [c.id for c in first.cards] == [8, 3]
+    assert game.stay(player)
+    assert player.hand is second
+    assert [c.id for c in second.cards] == [8, 10]
+    assert not game.stay(player)
+
+    assert game.finish_round() == ['win', 'win']  # Dealer 16 draws to 26
+    assert player.money == 520
+
+
+def test_resplit_up_to_max_hands():
+    game = stacked([8, 6, 8, 10, 8, 8, 8], max_hands=3)
+    game.deal()
+    player = game.player
+    game.split(player)
+    assert game.can_split(player)
+    game.split(player)
+    assert len(player.hands) == 3
+    assert player.hand.is_pair()
+    assert not game.can_split(player)
+
+
+def test_split_aces_take_one_card():
+    game = stacked([1, 6, 1, 10, 9, 5])
+    game.deal()
+    player = game.player
+    game.split(player)
+    assert player.hand.done
+    assert not game.can_hit(player)
+    assert game.stay(player)
+    assert player.hand.done
+    assert not game.stay(player)
+    assert game.finish_round() == ['win', 'lose']  # 20 and 16 against 16
+
+
+def test_resplit_aces_cannot_hit():
+    game = stacked([1, 6, 1, 10, 1, 5], resplit_aces=True)
+    game.deal()
+    player = game.player
+    game.split(player)
+    assert not player.hand.done
+    assert game.can_split(player)
+    assert not game.can_hit(player)
+    with pytest.raises(ValueError):
+        game.hit(player)
+
+
+def test_hit_split_aces():
+    game = stacked([1, 6, 1, 10, 2, 5], hit_split_aces=True)
+    game.deal()
+    player = game.player
+    game.split(player)
+    assert game.can_hit(player)
+    game.hit(player)
+    assert len(player.hand.cards) == 3
+
+
+def test_surrender():
+    game = stacked([10, 10, 6, 9], surrender=True)
+    game.deal()
+    player = game.player
+    assert game.can_surrender(player)
+    game.surrender_hand(player)
+    assert game.finish_round() == ['surrender']
+    assert player.hand.net == -5
+    assert player.money == 495
+
+    game = stacked([10, 10, 6, 9])
+    game.deal()
+    assert not game.can_surrender(game.player)
+    with pytest.raises(ValueError):
+        game.surrender_hand(game.player)
+
+
+def test_pool_recycles_split_hands():
+    game = stacked([8, 6, 8, 10, 3, 10, 10] * 2)  # Two rounds of seven cards
+    for round_ in range(2):
+        game.deal()
+        game.split(game.player)
+        while game.stay(game.player):
+            pass
+        game.finish_round()
+    assert game.pool.created == 1
+
+
+def test_snapshot_with_split_hands():
+    game = stacked([8, 6, 8, 10, 3, 10, 10])
+    game.deal()
+    player = game.player
+    game.split(player)
+    game.stay(player)
+    data = game.snapshot()
+
+    copy = Blackjack(10, decks=2)
+    copy.restore(data)
+    assert copy.snapshot() == data
+    assert [[c.code for c in hand.cards] for hand in copy.player.hands] == \
+        [[c.code for c in hand.cards] for hand in player.hands]
+    assert copy.player.hands.index(copy.player.hand) == 1
+    assert [hand.flags() for hand in copy.player.hands] == \
+        [hand.flags() for hand in player.hands]
+
+
+@pytest.mark.parametrize('upcard', range(1, 11))
+def test_dealer_outcomes_sum_to_one(upcard):
+    counts = [0] + [4] * 9 + [16]
+    calculator = ExactCalculator()
+    outcomes = calculator._dealer_upcard(pack_counts(counts), 52, upcard)
+    assert sum(outcomes) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('decks', [1, 2, 6])
+def test_batch_matches_blackjack(decks):
+    assert verify(strategy_table(mimic_dealer), decks=decks)
+
+
+def test_verify_rejects_shoes_run_out_mid_round():
+    with pytest.raises(ValueError):
+        verify(strategy_table(mimic_dealer), decks=1, shuffle=0)
@@ -0,0 +1,225 @@
+"""This module compares strategies, or table rules, with common random
+numbers. Every entry plays the same trials, and a trial starts from a shoe
+seeded by the run seed and the trial number, so each entry sees the same
+card orders. The results are paired trial by trial, and the luck of the
+cards largely cancels out of the differences between entries.
+
+Run ``python tournament.py dealer basic`` to compare two strategies or
+``python tournament.py basic basic:h17`` to compare two sets of rules.
+"""
+__all__ = ['Entry', 'Standing', 'run_tournament', 'trial_rng']
+
+import math
+import random
+import sys
+import time
+
+from cards import Blackjack
+from simulation import STRATEGIES, play_seats
+from stats import Z_95
+
+
+def trial_rng(seed, trial):
+    """Return the random generator that shuffles one trial's shoe."""
+
+    return random.Random('{0}:trial:{1}'.format(seed, trial))
+
+
+# Rule flags an entry can add to its strategy name. There is no flag for a
+# continuous shuffler, whose shoe shuffles each round's cards back in and
+# so cannot deal the same card orders as the other entries.
+RULES = {
+    'h17': ('hit_soft_17', True),
+    'nodas': ('double_after_split', False),
+    'surrender': ('surrender', True),
+    'rsa': ('resplit_aces', True),
+}
+
+
+class Entry(object):
+    """One contestant: a strategy callback and the Blackjack keyword
+    arguments of the table it plays at. A strategy of None plays basic
+    strategy for the table's rules.
+    """
+
+    def __init__(self, name, strategy, **rules):
+        self.name = name
+        self.strategy = strategy
+        self.rules = rules
+
+
+class Standing(object):
+    """Per trial results of one entry, in bets won per round."""
+
+    def __init__(self, entry, trials):
+        self.entry = entry
+        self.results = [0.0] * trials
+        self.hands = 0
+
+    def mean(self):
+        return sum(self.results) / len(self.results)
+
+    def variance(self):
+        return _variance(self.results)
+
+
+def _variance(values):
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def _sync(games):
+    """Burn cards so every shoe starts the next round at the same card,
+    the furthest any entry has dealt to.
+    """
+
+    position = max(game.deck.position for game in games)
+    for game in games:
+        deck = game.deck
+        while deck.position < position and deck.position < deck.cut:
+            deck.draw_code()
+
+
+def run_tournament(entries, trials=2000, rounds=50, seed=0, bet=5,
+                   decks=6, shuffle=25, paired=True):
+    """Play every entry for trials trials of rounds rounds each and return
+    a Standing per entry.
+
+    Each trial shuffles every entry's shoe with the same seed and the
+    entries play each round in lock-step, with the shoes that dealt fewer
+    cards last round burning up to the others, so every round is dealt
+    from the same cards. With paired False every entry gets its own shoes
+    instead, which is only useful to measure what the pairing buys.
+    """
+
+    games = []
+    strategies = []
+    standings = []
+    for entry in entries:
+        rules = dict(decks=decks, shuffle=shuffle)
+        rules.update(entry.rules)
+        game = Blackjack(bet, **rules)
+        strategy = entry.strategy
+        if strategy is None:
+            from strategy import BasicStrategy
+            strategy = BasicStrategy.for_game(game).play
+        games.append(game)
+        strategies.append(strategy)
+        standings.append(Standing(entry, trials))
+
+    for trial in range(trials):
+        for index, game in enumerate(games):
+            run_seed = seed if paired else '{0}:{1}'.format(seed, index)
+            game.deck.reset(trial_rng(run_seed, trial))
+
+        net = [0.0] * len(games)
+        for round_ in range(rounds):
+            if paired:
+                _sync(games)
+            for index, game in enumerate(games):
+                play_seats(game, strategies[index])
+                for player in game.players:
+                    for hand in player.hands:
+                        net[index] += hand.net
+                        standings[index].hands += 1
+
+        for index, standing in enumerate(standings):
+            standing.results[trial] = net[index] / (bet * rounds)
+
+    return standings
+
+
+def compare(baseline, other):
+    """Return (difference, half width, variance reduction factor) of the
+    mean bets won per round of other less baseline. The half width is of
+    a 95% confidence interval on the paired differences, and the factor
+    is how many times more trials independent runs would need for the
+    same interval.
+    """
+
+    trials = len(baseline.results)
+    differences = [b - a for a, b in zip(baseline.results, other.results)]
+    paired = _variance(differences)
+    independent = baseline.variance() + other.variance()
+    half_width = Z_95 * math.sqrt(paired / trials)
+    factor = independent / paired if paired else float('inf')
+    return sum(differences) / trials, half_width, factor
+
+
+def report(standings):
+    """Return the standings and the paired differences against the first
+    entry formatted for printing.
+    """
+
+    trials = len(standings[0].results)
+    lines = ['{0:<16} {1:>10} {2:>10} {3:>10}'.format('entry', 'EV/round',
+                                                     '95% +/-', 'hands')]
+    for standing in standings:
+        lines.append('{0:<16} {1:>+10.4f} {2:>10.4f} {3:>10,}'.format(
+            standing.entry.name, standing.mean(),
+            Z_95 * math.sqrt(standing.variance() / trials), standing.hands))
+
+    baseline = standings[0]
+    lines.append('')
+    lines.append('Paired against {0}'.format(baseline.entry.name))
+    lines.append('{0:<16} {1:>10} {2:>10} {3:>10}'.format('entry',
+                                                         'difference',
+                                                         '95% +/-', 'VRF'))
+    for standing in standings[1:]:
+        difference, half_width, factor = compare(baseline, standing)
+        lines.append('{0:<16} {1:>+10.4f} {2:>10.4f} {3:>9.1f}x'.format(
+            standing.entry.name, difference, half_width, factor))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Compare strategies on the same shoes.')
+    parser.add_argument('entries', nargs='*', default=['dealer', 'basic'],
+                        help='entries to compare, the first is the baseline. '
+                             'Each is a strategy, one of {0}, with optional '
+                             'rules after colons, from {1}'.format(
+                                 ', '.join(sorted(STRATEGIES)),
+                                 ', '.join(sorted(RULES))))
+    parser.add_argument('-t', '--trials', type=int, default=2000,
+                        help='number of shoes each strategy plays')
+    parser.add_argument('-r', '--rounds', type=int, default=50,
+                        help='rounds played from each shoe')
+    parser.add_argument('-d', '--decks', type=int, default=6,
+                        help='number of decks in the shoe')
+    parser.add_argument('--seats', type=int, default=1,
+                        help='players at each table')
+    parser.add_argument('--h17', action='store_true',
+                        help='dealer hits soft 17')
+    parser.add_argument('--independent', action='store_true',
+                        help='give every strategy its own shoes')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for a reproducible run')
+    args = parser.parse_args(argv)
+
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 32)
+
+    entries = []
+    for spec in args.entries:
+        name, *flags = spec.split(':')
+        if name not in STRATEGIES or not set(flags) <= set(RULES):
+            parser.error('unknown entry {0}'.format(spec))
+        rules = dict(RULES[flag] for flag in flags)
+        rules.setdefault('hit_soft_17', args.h17)
+        strategy = None if name == 'basic' else STRATEGIES[name]
+        entries.append(Entry(spec, strategy, seats=args.seats, **rules))
+    start = time.perf_counter()
+    standings = run_tournament(entries, args.trials, args.rounds,
+                               seed=args.seed, decks=args.decks,
+                               paired=not args.independent)
+    print('Seed: {0}  Trials: {1:,} of {2} rounds  ({3:.1f} s)'.format(
+        args.seed, args.trials, args.rounds, time.perf_counter() - start))
+    print(report(standings))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,7 +1,16 @@
-import os
+import queue
 import sys
+import threading
+import time
 from tkinter import *
+from tkinter import simpledialog
 from tkinter import ttk
+from cardimages import CardImages
+from cards import Blackjack
+from players import MINIMUM_BET, MAXIMUM_BET
+from simulation import STRATEGIES, play_round
+
+AUTOPLAY_FPS = 30  # Most table redraws per second while autoplaying
 
 
 class NamePrompt:
@@ -74,6 +83,56 @@ class NamePrompt:
         return self.playerID
 
 
+class CardSlots:
+    """A pool of card labels for one hand on the table. Labels are created
+    the first time a hand needs that many slots and reused after that, and
+    show() only reconfigures the slots whose card changed.
+    """
+
+    def __init__(self, parent, images, background):
+        self.parent = parent
+        self.images = images
+        self.background = background
+        self.labels = []        # Label widget per slot
+        self.shown = []         # (code, faceup) shown in each slot, or None
+        self.reconfigures = 0   # Label reconfigures since creation
+
+    def show(self, cards):
+        """Make the slots show the given cards, left to right."""
+
+        count = 0
+        for index, card in enumerate(cards):
+            count += 1
+            state = (card.code, card.face())
+            if index < len(self.shown) and self.shown[index] == state:
+                continue
+
+            if index == len(self.labels):
+                label = ttk.Label(self.parent, background=self.background,
+                                  style="Table.TLabel")
+                self.labels.append(label)
+                self.shown.append(None)
+            label = self.labels[index]
+
+            image = self.images.image(card)
+            if image is not None:
+                label.configure(image=image, text='')
+            elif card.face():
+                label.configure(image='', text=str(card))
+            else:
+                label.configure(image='', text='Face down')
+            if self.shown[index] is None:
+                label.grid_configure(column=index, row=0, padx=2,
+                                     sticky=(N, S, E, W))
+            self.shown[index] = state
+            self.reconfigures += 1
+
+        for index in range(count, len(self.labels)):
+            if self.shown[index] is not None:
+                self.labels[index].grid_remove()
+                self.shown[index] = None
+
+
 class HelpAboutWindow:
     """Create a window for the About option in the Help menu."""
 
@@ -85,14 +144,17 @@ class GameWindow:
     """
     Create an initial Tkinter window for the main game
     """
-    def __init__(self, playerid):
+    def __init__(self, playerid, profiles=None):
 
         self.playerid = playerid
+        self.profiles = profiles  # ProfileStore, or None to keep nothing
 
         self.root = Tk()
         self.root.title("Blackjack")
         self.tableColor = "#339955"
         self.root.geometry("800x600")
+        # Closing from the title bar goes through the same clean exit
+        self.root.protocol('WM_DELETE_WINDOW', self._exit_handler)
 
         self.mainframe = ttk.Frame(self.root, padding="3 3 12 12")
         self.mainframe.grid(column=0, row=0, sticky=(N, W, E, S))
@@ -118,11 +180,34 @@ class GameWindow:
         self.tableButtonStyle.configure("GreenBG.TButton",
                                         background=self.tableColor)
 
-        self.tableMessage = None  # Initialize empty table action message
+        self.tableMessage = StringVar()  # Table action message
+        self.images = CardImages(self.root)  # Shared card image cache
+
+        self.game = Blackjack(bet=MINIMUM_BET, surrender=True)
+        self.game.player.name = self.playerid
+        if self.profiles is not None:
+            self.profiles.load(self.game.player)  # Pick up where they left
+        self.roundOver = True   # No hand is being played
+        self.redrawCount = 0    # Table redraws since the window opened
+        self.redrawTime = 0.0   # Seconds spent in those redraws
+
+        self.cashText = StringVar()
+        self.betText = StringVar()
+        self.highWonText = StringVar()
+        self.highLossText = StringVar()
+        self.statValues = {}    # Last value shown per stat variable
+
+        self.autoplayStrategy = StringVar(value='dealer')
+        self.autoplayQueue = queue.Queue()  # Round results from the worker
+        self.autoplayCancel = threading.Event()
+        self.autoplayThread = None
+        self.autoplayHands = 0
+        self.autoplayPlayed = 0  # Rounds the worker has queued so far
 
         self._menu_bar()
         self._left_side_bar()
-        #self._card_table()
+        self._card_table()
+        self._update_stats()
 
         self.root.mainloop()
 
@@ -138,6 +223,12 @@ class GameWindow:
         """
         Destroy the window and exit the program immediately
         """
+        self.autoplayCancel.set()
+        if self.autoplayThread is not None:
+            self.autoplayThread.join()  # Let the round in play settle
+            self._drain_autoplay()      # and save the rounds played
+        if self.profiles is not None:
+            self.profiles.flush()
         self.root.destroy()
         sys.exit()
 
@@ -150,7 +241,16 @@ class GameWindow:
         """
         menuBar = Menu(self.root)
         fileMenu = Menu(menuBar, tearoff=False)
-        fileMenu.add_command(label="Deal", command=self.tester)
+        fileMenu.add_command(label="Deal", command=self._deal_handler)
+        strategyMenu = Menu(fileMenu, tearoff=False)
+        for name in sorted(STRATEGIES):
+            strategyMenu.add_radiobutton(label=name, value=name,
+                                         variable=self.autoplayStrategy)
+        fileMenu.add_cascade(label="Autoplay strategy", menu=strategyMenu)
+        fileMenu.add_command(label="Autoplay N hands...",
+                             command=self._autoplay_handler)
+        fileMenu.add_command(label="Stop autoplay",
+                             command=self._stop_autoplay_handler)
         fileMenu.add_command(label="Quit", command=self._exit_handler)
         helpMenu = Menu(menuBar, tearoff=False)
         helpMenu.add_command(label="About", command=self.tester)
@@ -181,33 +281,42 @@ class GameWindow:
 
         ### Statistics boxes instantiation ###
         cashLabel = ttk.Label(leftFrame, text=cashText)
-        cashTotalLabel = ttk.Label(leftFrame, text="$500", relief=SUNKEN,
-                                   style="Stats.TLabel")
+        cashTotalLabel = ttk.Label(leftFrame, textvariable=self.cashText,
+                                   relief=SUNKEN, style="Stats.TLabel")
         betLabel = ttk.Label(leftFrame, text=betText)
-        betAmountLabel = ttk.Label(leftFrame, text="$5", relief=SUNKEN,
-                                   style="Stats.TLabel")
+        betAmountLabel = ttk.Label(leftFrame, textvariable=self.betText,
+                                   relief=SUNKEN, style="Stats.TLabel")
         highWonLabel = ttk.Label(leftFrame, text=wonText)
-        highWonStatLabel = ttk.Label(leftFrame, text="$50", relief=SUNKEN,
-                                   style="Stats.TLabel")
+        highWonStatLabel = ttk.Label(leftFrame,
+                                     textvariable=self.highWonText,
+                                     relief=SUNKEN, style="Stats.TLabel")
         highLossLabel = ttk.Label(leftFrame, text=lossText)
-        highLossStatLabel = ttk.Label(leftFrame, text="$30", relief=SUNKEN,
-                                   style="Stats.TLabel")
+        highLossStatLabel = ttk.Label(leftFrame,
+                                      textvariable=self.highLossText,
+                                      relief=SUNKEN, style="Stats.TLabel")
         minBetLabel = ttk.Label(leftFrame, text="Minimum allowed bet:")
-        minBetStatLabel = ttk.Label(leftFrame, text="$5")
+        minBetStatLabel = ttk.Label(leftFrame,
+                                    text="${0}".format(MINIMUM_BET))
         maxBetLabel = ttk.Label(leftFrame, text="Maximum allowed bet:")
-        maxBetStatLabel = ttk.Label(leftFrame, text="$5000")
+        maxBetStatLabel = ttk.Label(leftFrame,
+                                    text="${0}".format(MAXIMUM_BET))
 
         ### Action buttons instantiation ###
         hitButton = ttk.Button(leftFrame, text='Hit', padding=8,
-                               command=self.tester)
+                               command=self._hit_handler)
         standButton = ttk.Button(leftFrame, text='Stand', padding=8,
-                                 command=self.tester)
+                                 command=self._stand_handler)
         doubleButton = ttk.Button(leftFrame, text='Double down',
-                                  padding=8, command=self.tester)
+                                  state=DISABLED, padding=8,
+                                  command=self._double_handler)
         splitButton = ttk.Button(leftFrame, text='Split', state=DISABLED,
-                                 padding=8, command=self.tester)
+                                 padding=8, command=self._split_handler)
         surrenderButton = ttk.Button(leftFrame, text='Surrender', padding=8,
-                                     state=DISABLED, command=self.tester)
+                                     state=DISABLED,
+                                     command=self._surrender_handler)
+        self.actionButtons = ((doubleButton, self.game.can_double),
+                              (splitButton, self.game.can_split),
+                              (surrenderButton, self.game.can_surrender))
 
         ### Configure all elements in side bar ###
         cashLabel.pack_configure(expand=True, fill=BOTH)
@@ -253,46 +362,276 @@ class GameWindow:
         #tableFrame.grid_rowconfigure(0, weight=1)
         
         dealButton = ttk.Button(buttonFrame, text='Deal', padding=8,
-                                style="GreenBG.TButton", command=self.tester)
+                                style="GreenBG.TButton",
+                                command=self._deal_handler)
 
         shuffleButton = ttk.Button(buttonFrame, text='Shuffle', padding=8,
-                                   style="GreenBG.TButton", command=self.tester)
+                                   style="GreenBG.TButton",
+                                   command=self._shuffle_handler)
 
-        img2_path = os.path.join('images', 'Blue_Back.gif')
-        self.card2_img = PhotoImage(file=img2_path)
-        
-        card2ImgLabel = ttk.Label(dealerCardFrame, image=self.card2_img,
-                                 background=self.tableColor)
-        
-        img_path = os.path.join('images', 'KH.gif')
-        self.card_img = PhotoImage(file=img_path)
-        
-        cardImgLabel = ttk.Label(dealerCardFrame, image=self.card_img,
-                                 background=self.tableColor)
+        self.dealerSlots = CardSlots(dealerCardFrame, self.images,
+                                     self.tableColor)
+        self.playerSlots = CardSlots(playerCardFrame, self.images,
+                                     self.tableColor)
 
-        card3ImgLabel = ttk.Label(playerCardFrame, image=self.card_img,
-                                 background=self.tableColor)
-        
-        card4ImgLabel = ttk.Label(playerCardFrame, image=self.card_img,
-                                 background=self.tableColor)
-
-        card5ImgLabel = ttk.Label(playerCardFrame, image=self.card_img,
-                                 background=self.tableColor)
-
-        messageLabel = ttk.Label(messageFrame,
-                                 text='Dealer: "What would you like to do?"',
+        self.tableMessage.set('Dealer: "Press Deal to start a hand."')
+        messageLabel = ttk.Label(messageFrame, textvariable=self.tableMessage,
                                  style="Table.TLabel")
 
         dealButton.grid_configure(column=0, row=0, padx=4, sticky=(N, S, E, W))
-        shuffleButton.grid_configure(column=1, row=0, padx=4, sticky=(N, S, E, W))
-
-        card2ImgLabel.grid_configure(column=0, row=0, sticky=(N, S, E, W))
-        cardImgLabel.grid_configure(column=1, row=0, sticky=(N, S, E, W))
+        shuffleButton.grid_configure(column=1, row=0, padx=4,
+                                     sticky=(N, S, E, W))
 
         messageLabel.pack_configure(expand=True, fill=BOTH, anchor="center")
 
-        card3ImgLabel.grid_configure(column=0, row=0, sticky=(N, S, E, W))
-        card4ImgLabel.grid_configure(column=1, row=0, sticky=(N, S, E, W))
+    def _set_stat(self, variable, value):
+        """Set a stat variable only if its value changed."""
+
+        if self.statValues.get(str(variable)) != value:
+            self.statValues[str(variable)] = value
+            variable.set('${0:,.2f}'.format(value).replace('.00', ''))
+
+    def _update_stats(self, stats=None):
+        """Refresh the side bar stats from the player, or from a tuple of
+        money, bet, highest win and highest loss.
+        """
+
+        if stats is None:
+            player = self.game.player
+            stats = (player.money, player.current_bet, player.highest_win,
+                     player.highest_loss)
+        self._set_stat(self.cashText, stats[0])
+        self._set_stat(self.betText, stats[1])
+        self._set_stat(self.highWonText, stats[2])
+        self._set_stat(self.highLossText, stats[3])
+
+    def _redraw(self):
+        """Bring the table up to date with the game, reconfiguring only the
+        card slots and stats that changed.
+        """
+
+        start = time.perf_counter()
+        self.dealerSlots.show(self.game.dealer)
+        self.playerSlots.show(self.game.player)
+        self._update_stats()
+        self._update_actions()
+        self.redrawTime += time.perf_counter() - start
+        self.redrawCount += 1
+
+    def _update_actions(self):
+        """Enable the Double down, Split and Surrender buttons only while
+        the hand in play allows them.
+        """
+
+        player = self.game.player
+        for button, allowed in self.actionButtons:
+            if not self.roundOver and allowed(player):
+                button.state(['!disabled'])
+            else:
+                button.state(['disabled'])
+
+    def _autoplaying(self):
+        """Return True while the autoplay worker owns the game."""
+
+        return self.autoplayThread is not None
+
+    def _autoplay_handler(self):
+        """Ask for a number of hands and play them on a worker thread."""
+
+        if not self.roundOver or self._autoplaying():
+            return
+
+        hands = simpledialog.askinteger("Autoplay", "Number of hands:",
+                                        parent=self.root, minvalue=1,
+                                        initialvalue=1000)
+        if not hands:
+            return
+
+        self.autoplayHands = hands
+        self.autoplayPlayed = 0
+        self.autoplayCancel.clear()
+        strategy = STRATEGIES[self.autoplayStrategy.get()]
+        self.autoplayThread = threading.Thread(
+            target=self._autoplay_worker, args=(hands, strategy), daemon=True)
+        self.autoplayThread.start()
+        self.root.after(1000 // AUTOPLAY_FPS, self._drain_autoplay)
+
+    def _stop_autoplay_handler(self):
+        """Cancel autoplay after the round being played."""
+
+        self.autoplayCancel.set()
+
+    def _autoplay_worker(self, hands, strategy):
+        """Play rounds and queue a snapshot of each one. Runs off the Tk
+        thread and never waits on the window.
+        """
+
+        game = self.game
+        player = game.player
+        for hand in range(1, hands + 1):
+            if self.autoplayCancel.is_set():
+                break
+            outcome = play_round(game, strategy)
+            self.autoplayQueue.put((hand, outcome, tuple(game.dealer),
+                                    tuple(player),
+                                    (player.money, player.current_bet,
+                                     player.highest_win,
+                                     player.highest_loss)))
+        self.autoplayQueue.put(None)  # Finished or cancelled
+
+    def _drain_autoplay(self):
+        """Show the newest queued round, skipping any older ones, and check
+        again after one frame until the worker is finished.
+        """
+
+        latest = None
+        finished = False
+        while True:
+            try:
+                item = self.autoplayQueue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                finished = True
+            else:
+                latest = item
+
+        if latest is not None:
+            hand, outcome, dealerCards, playerCards, stats = latest
+            self.autoplayPlayed = hand
+            start = time.perf_counter()
+            self.dealerSlots.show(dealerCards)
+            self.playerSlots.show(playerCards)
+            self._update_stats(stats)
+            self.redrawTime += time.perf_counter() - start
+            self.redrawCount += 1
+            self.tableMessage.set('Autoplay: hand {0} of {1}, {2}'.format(
+                hand, self.autoplayHands, outcome))
+
+        if finished:
+            self.autoplayThread.join()
+            self.autoplayThread = None
+            if self.profiles is not None and self.autoplayPlayed:
+                self.profiles.settle(self.game.player, self.autoplayPlayed)
+            self._update_stats()
+        else:
+            self.root.after(1000 // AUTOPLAY_FPS, self._drain_autoplay)
+
+    def _deal_handler(self):
+        """Start a new hand if the last one is finished."""
+
+        if not self.roundOver or self._autoplaying():
+            return
+
+        self.game.deal()
+        self.roundOver = False
+        self.tableMessage.set('Dealer: "What would you like to do?"')
+
+        player = self.game.player
+        if player.is_blackjack() or self.game.dealer.is_blackjack():
+            self._finish_round()
+        else:
+            self._redraw()
+
+    def _hit_handler(self):
+        """Give the player another card."""
+
+        player = self.game.player
+        if self.roundOver or not self.game.can_hit(player):
+            return
+
+        self.game.hit(player)
+        if self.game.check_hand(player) != 'okay':
+            self._next_hand()
+        else:
+            self._redraw()
+
+    def _stand_handler(self):
+        """End the hand in play."""
+
+        if self.roundOver:
+            return
+
+        self._next_hand()
+
+    def _double_handler(self):
+        """Double the bet and take one last card."""
+
+        if self.roundOver or not self.game.can_double(self.game.player):
+            return
+
+        self.game.double(self.game.player)
+        self._next_hand()
+
+    def _split_handler(self):
+        """Split a pair into two hands."""
+
+        player = self.game.player
+        if self.roundOver or not self.game.can_split(player):
+            return
+
+        self.game.split(player)
+        if player.hand.done or self.game.check_hand(player) != 'okay':
+            self._next_hand()
+        else:
+            self._show_hand_number()
+            self._redraw()
+
+    def _surrender_handler(self):
+        """Give up the hand for half the bet back."""
+
+        if self.roundOver or not self.game.can_surrender(self.game.player):
+            return
+
+        self.game.surrender_hand(self.game.player)
+        self._next_hand()
+
+    def _next_hand(self):
+        """Move on to the player's next split hand that needs a decision,
+        or finish the round when there is none.
+        """
 
-        card5ImgLabel.grid_configure(column=2, row=0, sticky=(N, S, E, W))
+        player = self.game.player
+        while self.game.stay(player):
+            if not player.hand.done and \
+                    self.game.check_hand(player) == 'okay':
+                self._show_hand_number()
+                self._redraw()
+                return
+        self._finish_round()
+
+    def _show_hand_number(self):
+        player = self.game.player
+        self.tableMessage.set('Dealer: "Playing hand {0} of {1}."'.format(
+            player.hands.index(player.hand) + 1, len(player.hands)))
+
+    def _shuffle_handler(self):
+        """Shuffle the shoe between hands."""
+
+        if self.roundOver and not self._autoplaying():
+            self.game.deck.shuffle()
+            self.tableMessage.set('Dealer: "The shoe has been shuffled."')
+
+    def _finish_round(self):
+        """Play the dealer's hand, settle the bet and show the result."""
+
+        player = self.game.player
+        dealer = self.game.dealer
+        self.game.finish_round()
+        if self.profiles is not None:
+            self.profiles.settle(player, len(player.hands))
+
+        messages = {
+            'blackjack': 'Blackjack! You win.',
+            'win': 'You win.',
+            'push': 'Push.',
+            'lose': 'You lose.',
+            'surrender': 'You surrender.',
+        }
+        results = ['{0} ({1} to {2})'.format(messages[hand.outcome],
+                                             hand.score(), dealer.score())
+                   for hand in player.hands]
+        self.tableMessage.set('Dealer: "{0}"'.format(' '.join(results)))
+        self.roundOver = True
+        self._redraw()
 